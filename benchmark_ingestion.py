@@ -0,0 +1,408 @@
+# benchmark_ingestion.py
+#
+# Reproducible benchmark for populate_daily_prices.py and update_tickers.py.
+#
+# Starts a local fake HTTP server that stands in for the Next.js API and the
+# ticker feed, serving synthetic quotes, price histories and a ticker list with
+# configurable symbol counts, history lengths and injected latency. The pipeline
+# runs in a child process against a throwaway MySQL database created from
+# moneygoup_schema.sql. Per-stage timings and counters come from the run summary
+# the pipeline logs through ingest_metrics.py; the results are printed (or written)
+# as JSON so runs can be compared across commits.
+#
+# Required packages:
+# pip install mysql-connector-python python-dotenv requests numpy textblob
+#
+# A MySQL server is required; the benchmark database is created and dropped on it.
+# Connection settings come from BENCH_DB_HOST / BENCH_DB_USER / BENCH_DB_PASSWORD
+# (falling back to DB_HOST / DB_USER / DB_PASSWORD).
+#
+# Example:
+# python benchmark_ingestion.py --symbols 200 --history-days 2500 --latency-ms 50 --runs 2 --output bench.json
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import mysql.connector
+
+from trading_calendar import is_trading_day
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'moneygoup_schema.sql')
+
+# --- Fake upstream server ---
+
+class FakeUpstream:
+    """Deterministic synthetic market data for the fake server."""
+
+    def __init__(self, symbols, history_days, latency_ms, seed=42):
+        self.symbols = symbols
+        self.latency = latency_ms / 1000.0
+        self.seed = seed
+        self.trading_days = self._trading_days(history_days)
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _trading_days(count):
+        days = []
+        day = date.today()
+        while len(days) < count:
+            if is_trading_day(day):
+                days.append(day)
+            day -= timedelta(days=1)
+        return days[::-1]
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def history(self, symbol, start=None):
+        rng = random.Random(f"{self.seed}:{symbol}")
+        price = rng.uniform(10, 500)
+        records = []
+        for day in self.trading_days:
+            close = round(price * math.exp(rng.gauss(0, 0.02)), 2)
+            volume = rng.randint(100000, 5000000)  # drawn for every bar so `start` does not shift the series
+            if start is None or day >= start:
+                records.append({
+                    'date': day.isoformat(),
+                    'datetime': f"{day.isoformat()}T00:00:00.000Z",
+                    'open': price,
+                    'high': round(max(price, close) * 1.01, 2),
+                    'low': round(min(price, close) * 0.99, 2),
+                    'close': close,
+                    'volume': volume,
+                    'adjOpen': price,
+                    'adjHigh': close,
+                    'adjLow': close,
+                    'adjClose': close,
+                    'adjVolume': None,
+                })
+            price = close
+        return records
+
+    def quote(self, symbol):
+        rng = random.Random(f"{self.seed}:{symbol}:quote")
+        return {'symbol': symbol, 'price': round(rng.uniform(10, 500), 2)}
+
+    def tickers(self):
+        return [
+            {'ticker': symbol, 'name': f"{symbol} Holdings, Inc.", 'is_etf': None, 'exchange': 'NASDAQ'}
+            for symbol in self.symbols
+        ]
+
+def make_handler(upstream):
+    quote_path = re.compile(r'^/api/stock/quote/([^/]+)$')
+    history_path = re.compile(r'^/api/stock/([^/]+)/historical/[^/]+$')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real server
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if upstream.latency:
+                time.sleep(upstream.latency)
+
+            if url.path == '/api/stock/quote':
+                upstream.count('quote_batch')
+                symbols = [symbol for symbol in parse_qs(url.query).get('symbols', [''])[0].split(',') if symbol]
+                quotes = [upstream.quote(symbol) for symbol in dict.fromkeys(symbols)]
+                return self._json({'quotes': quotes, 'missing': []})
+
+            match = quote_path.match(url.path)
+            if match:
+                upstream.count('quote')
+                return self._json(upstream.quote(match.group(1)))
+
+            match = history_path.match(url.path)
+            if match:
+                upstream.count('history')
+                start = parse_qs(url.query).get('start', [None])[0]
+                start = date.fromisoformat(start) if start else None
+                return self._json({'historicalData': upstream.history(match.group(1), start), 'source': ['Fake']})
+
+            if url.path == '/tickers':
+                upstream.count('tickers')
+                etag = f'"tickers-{len(upstream.symbols)}-{upstream.seed}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                return self._json(upstream.tickers(), {'ETag': etag})
+
+            self.send_error(404)
+
+        def _json(self, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_fake_server(upstream):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(upstream))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Throwaway database ---
+
+def bench_db_settings():
+    return {
+        'host': os.getenv('BENCH_DB_HOST', os.getenv('DB_HOST', '127.0.0.1')),
+        'user': os.getenv('BENCH_DB_USER', os.getenv('DB_USER', 'root')),
+        'password': os.getenv('BENCH_DB_PASSWORD', os.getenv('DB_PASSWORD', '')),
+    }
+
+def schema_statements():
+    """Splits the schema dump into individual DDL statements, leaving out its sample data."""
+    with open(SCHEMA_FILE) as f:
+        sql = "\n".join(line for line in f.read().splitlines() if not line.startswith('--'))
+    statements = [statement.strip() for statement in sql.split(';\n') if statement.strip()]
+    return [
+        statement for statement in statements
+        if not statement.startswith(('INSERT', 'LOCK TABLES', 'UNLOCK TABLES'))
+    ]
+
+def create_bench_database(settings, database, symbols, users, stocks_per_user):
+    connection = mysql.connector.connect(**settings)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+    for statement in schema_statements():
+        cursor.execute(statement)
+
+    cursor.executemany(
+        "INSERT INTO stocks (symbol, company_name) VALUES (%s, %s)",
+        [(symbol, f"{symbol} Holdings, Inc.") for symbol in symbols]
+    )
+    cursor.executemany(
+        "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+        [(f"bench_user_{i}", 'x') for i in range(users)]
+    )
+    cursor.execute("SELECT id FROM stocks ORDER BY id")
+    stock_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM users ORDER BY id")
+    user_ids = [row[0] for row in cursor.fetchall()]
+    rng = random.Random(7)
+    cursor.executemany(
+        "INSERT INTO user_stocks (user_id, stock_id) VALUES (%s, %s)",
+        [
+            (user_id, stock_id)
+            for user_id in user_ids
+            for stock_id in rng.sample(stock_ids, min(stocks_per_user, len(stock_ids)))
+        ]
+    )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+def drop_bench_database(settings, database):
+    connection = mysql.connector.connect(**settings)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.close()
+    connection.close()
+
+def server_questions(settings):
+    """Global count of client statements, used to measure DB round trips."""
+    connection = mysql.connector.connect(**settings)
+    cursor = connection.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    questions = int(cursor.fetchone()[1])
+    cursor.close()
+    connection.close()
+    return questions
+
+@lru_cache(maxsize=None)
+def probe_questions(host, user, password):
+    """Statements counted by one server_questions() call itself, connection setup included."""
+    settings = {'host': host, 'user': user, 'password': password}
+    first = server_questions(settings)
+    return server_questions(settings) - first
+
+def table_count(settings, database, table):
+    connection = mysql.connector.connect(database=database, **settings)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    connection.close()
+    return count
+
+# --- Benchmark runs ---
+
+def read_run_summary(events_path):
+    """Returns the last run_summary event ingest_metrics appended to the events file."""
+    summary = None
+    with open(events_path) as f:
+        for line in f:
+            event = json.loads(line)
+            if event['event'] == 'run_summary':
+                summary = event
+    return summary
+
+def peak_rss_bytes(ru_maxrss):
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return ru_maxrss if sys.platform == 'darwin' else ru_maxrss * 1024
+
+def run_pipeline(settings, database, server_url, pipeline_args, workdir):
+    events_path = os.path.join(workdir, 'events.jsonl')
+    env = dict(os.environ)
+    env.update({
+        'DOTENV_FILE': os.path.join(workdir, 'no.env'),
+        'NEXTAUTH_URL': server_url,
+        'DB_HOST': settings['host'],
+        'DB_USER': settings['user'],
+        'DB_PASSWORD': settings['password'],
+        'DB_DATABASE': database,
+    })
+    args = [
+        '--sentiment-cache', os.path.join(workdir, 'sentiment.sqlite3'),
+        '--snapshot-dir', os.path.join(workdir, 'snapshot'),
+        '--metrics-events', events_path,
+        '--journal', os.path.join(workdir, 'journal.sqlite3'),
+        # Every run should measure real fetches; pass --cache-ttl after -- to benchmark cached runs
+        '--cache-ttl', '0',
+    ] + pipeline_args
+
+    rows_before = table_count(settings, database, 'stocksdailyprice')
+    questions_before = server_questions(settings)
+    started = time.perf_counter()
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        process = subprocess.Popen(
+            [sys.executable, 'populate_daily_prices.py'] + args,
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        # wait4 reports this child's own peak RSS, unlike RUSAGE_CHILDREN which keeps the max over all children
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - started
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"Pipeline failed with exit code {process.returncode}:\n{stderr.read()}")
+
+    summary = read_run_summary(events_path)
+    # Statements issued by the probe itself are not part of the pipeline
+    round_trips = server_questions(settings) - questions_before - probe_questions(**settings)
+    rows_after = table_count(settings, database, 'stocksdailyprice')
+    return {
+        'wall_seconds': wall,
+        'pipeline_seconds': summary['duration_seconds'],
+        'stages': summary['stages'],
+        'counters': summary['counters'],
+        'rows_written': rows_after - rows_before,
+        'db_round_trips': round_trips,
+        'peak_rss_bytes': peak_rss_bytes(usage.ru_maxrss),
+    }
+
+def run_update_tickers(server_url, workdir):
+    from ingest_metrics import RunMetrics
+    from update_tickers import update_company_tickers
+
+    output_path = os.path.join(workdir, 'tickers', 'company_tickers.json')
+    state_path = os.path.join(workdir, 'tickers_state.json')
+    results = {}
+    # The second refresh measures the conditional GET path
+    for run in ('initial', 'conditional'):
+        metrics = RunMetrics('update_tickers')
+        update_company_tickers(f"{server_url}/tickers", output_path, metrics, state_path=state_path)
+        results[run] = metrics.summary()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline against a fake upstream and a throwaway MySQL database.")
+    parser.add_argument('--symbols', type=int, default=100, help="Number of synthetic symbols (default: %(default)s).")
+    parser.add_argument('--history-days', type=int, default=1000, help="Trading days of history per symbol (default: %(default)s).")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latency injected into every fake response (default: %(default)s).")
+    parser.add_argument('--users', type=int, default=10, help="Synthetic users (default: %(default)s).")
+    parser.add_argument('--stocks-per-user', type=int, default=20, help="Watchlist size per user (default: %(default)s).")
+    parser.add_argument('--runs', type=int, default=1, help="Pipeline runs against the same database; runs after the first are incremental (default: %(default)s).")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument('--keep-db', action='store_true', help="Do not drop the benchmark database afterwards.")
+    parser.add_argument('pipeline_args', nargs='*', help="Extra arguments for populate_daily_prices.py, after --.")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+    upstream = FakeUpstream(symbols, args.history_days, args.latency_ms)
+    server = start_fake_server(upstream)
+    server_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    settings = bench_db_settings()
+    database = f"moneygoup_bench_{os.getpid()}"
+    create_bench_database(settings, database, symbols, args.users, args.stocks_per_user)
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'symbols': args.symbols,
+            'history_days': args.history_days,
+            'latency_ms': args.latency_ms,
+            'users': args.users,
+            'stocks_per_user': args.stocks_per_user,
+            'pipeline_args': args.pipeline_args,
+        },
+        'runs': [],
+    }
+    try:
+        with tempfile.TemporaryDirectory(prefix='moneygoup_bench_') as workdir:
+            for run in range(args.runs):
+                upstream.requests.clear()
+                result = run_pipeline(settings, database, server_url, args.pipeline_args, workdir)
+                seconds = result['pipeline_seconds']
+                result.update({
+                    'run': run + 1,
+                    'stocks_per_second': args.symbols / seconds if seconds else None,
+                    'rows_per_second': result['rows_written'] / seconds if seconds else None,
+                    'upstream_requests': dict(upstream.requests),
+                })
+                results['runs'].append(result)
+            upstream.requests.clear()
+            results['update_tickers'] = run_update_tickers(server_url, workdir)
+    finally:
+        server.shutdown()
+        if not args.keep_db:
+            drop_bench_database(settings, database)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# compute_features.py
+#
+# Materializes derived price features into the stocksdailyfeature table so the
+# dashboard does not recompute them from full price history on every request.
+#
+# The indicators mirror src/utils/technicalIndicators.ts and src/utils/volatility.ts:
+# - sma20 / sma50: simple moving average of the last 20 / 50 closes
+# - rsi14: RSI from the simple average of the last 14 gains and losses
+# - momentum10: close minus the close 10 bars earlier
+# - volatility: annualized volatility (%) of all log returns up to that date
+# - daily_pct_change: percent change from the previous close
+#
+# Only bars newer than each stock's last feature row are computed. The running
+# log-return count, sum and sum of squares are stored with every row so the
+# full-history volatility can be extended without re-reading the history.
+#
+# Required packages:
+# pip install mysql-connector-python python-dotenv numpy
+#
+# It runs automatically at the end of populate_daily_prices.py, or on its own:
+# python compute_features.py [--full]
+
+import argparse
+
+import numpy as np
+from mysql.connector import Error
+
+SMA_SHORT_PERIOD = 20
+SMA_LONG_PERIOD = 50
+RSI_PERIOD = 14
+MOMENTUM_PERIOD = 10
+TRADING_DAYS = 252
+# Bars before each stock's last feature row needed to compute the next one
+LOOKBACK_BARS = max(SMA_LONG_PERIOD, RSI_PERIOD + 1, MOMENTUM_PERIOD + 1)
+WRITE_BATCH_SIZE = 5000
+
+FEATURE_COLUMNS = (
+    'stock_id', 'date', 'daily_pct_change', 'sma20', 'sma50', 'rsi14', 'momentum10',
+    'volatility', 'log_return_count', 'log_return_sum', 'log_return_sumsq'
+)
+
+def fetch_feature_states(connection):
+    """
+    Fetches the last feature row of every stock.
+    Returns a dict mapping stock_id to (last_date, log_return_count, log_return_sum, log_return_sumsq).
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT f.stock_id, f.`date`, f.log_return_count, f.log_return_sum, f.log_return_sumsq
+            FROM stocksdailyfeature f
+            JOIN (
+                SELECT stock_id, MAX(`date`) AS max_date
+                FROM stocksdailyfeature
+                GROUP BY stock_id
+            ) latest ON latest.stock_id = f.stock_id AND latest.max_date = f.`date`
+        """)
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def fetch_price_window(connection, full=False):
+    """
+    Fetches (stock_id, date, close) rows ordered by stock and date: every bar after each
+    stock's last feature row plus the LOOKBACK_BARS bars before it. With full=True, or
+    for stocks without features, the whole history is returned.
+    """
+    cursor = connection.cursor()
+    try:
+        if full:
+            cursor.execute("""
+                SELECT stock_id, `date`, `close`
+                FROM stocksdailyprice
+                ORDER BY stock_id, `date`
+            """)
+        else:
+            # Each featured stock is bounded to its own range first: the start date is the
+            # LOOKBACK_BARS-th bar on or before its last feature row, found by an index seek
+            # on (stock_id, date), so only the tail of the price table is read.
+            cursor.execute("""
+                SELECT p.stock_id, p.`date`, p.`close`
+                FROM (
+                    SELECT f.stock_id, (
+                        SELECT b.`date`
+                        FROM stocksdailyprice b
+                        WHERE b.stock_id = f.stock_id AND b.`date` <= f.last_date
+                        ORDER BY b.`date` DESC
+                        LIMIT 1 OFFSET %s
+                    ) AS start_date
+                    FROM (
+                        SELECT stock_id, MAX(`date`) AS last_date
+                        FROM stocksdailyfeature
+                        GROUP BY stock_id
+                    ) f
+                ) bounds
+                JOIN stocksdailyprice p
+                    ON p.stock_id = bounds.stock_id
+                    AND p.`date` >= COALESCE(bounds.start_date, '1000-01-01')
+                UNION ALL
+                SELECT p.stock_id, p.`date`, p.`close`
+                FROM stocksdailyprice p
+                WHERE NOT EXISTS (SELECT 1 FROM stocksdailyfeature f WHERE f.stock_id = p.stock_id)
+                ORDER BY stock_id, `date`
+            """, (LOOKBACK_BARS - 1,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def js_round2(values):
+    """Rounds to two decimals the way Math.round(x * 100) / 100 does (halves toward +infinity)."""
+    return np.floor(values * 100 + 0.5) / 100
+
+def rolling_sum(values, window):
+    """Sum of each trailing window of `window` values; positions before a full window are NaN."""
+    sums = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        sums[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).sum(axis=1)
+    return sums
+
+def compute_features(stock_ids, closes, is_new, initial_states):
+    """
+    Computes features for price rows sorted by (stock_id, date), across all stocks at once.
+
+    `is_new` marks the rows to compute features for; earlier rows of a stock are lookback
+    context already covered by `initial_states`, a dict mapping stock_id to its stored
+    (log_return_count, log_return_sum, log_return_sumsq). Returns a dict of column arrays
+    aligned with the input rows; values are NaN where the indicator is undefined.
+    """
+    n = len(closes)
+    index = np.arange(n)
+    group_start = np.flatnonzero(np.r_[True, stock_ids[1:] != stock_ids[:-1]]) if n else np.array([], dtype=int)
+    group_of_row = np.repeat(np.arange(len(group_start)), np.diff(np.r_[group_start, n]))
+    pos = index - group_start[group_of_row]  # bar position within its stock's window
+
+    prev_close = np.r_[np.nan, closes[:-1]]
+    prev_close[pos == 0] = np.nan
+    change = closes - prev_close
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_pct_change = change / prev_close * 100
+
+    sma20 = rolling_sum(closes, SMA_SHORT_PERIOD) / SMA_SHORT_PERIOD
+    sma20[pos < SMA_SHORT_PERIOD - 1] = np.nan
+    sma50 = rolling_sum(closes, SMA_LONG_PERIOD) / SMA_LONG_PERIOD
+    sma50[pos < SMA_LONG_PERIOD - 1] = np.nan
+
+    gains = np.where(change > 0, change, 0.0)
+    losses = np.where(change < 0, -change, 0.0)
+    avg_gain = rolling_sum(gains, RSI_PERIOD) / RSI_PERIOD
+    avg_loss = rolling_sum(losses, RSI_PERIOD) / RSI_PERIOD
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(avg_loss == 0, 100.0, js_round2(100 - 100 / (1 + avg_gain / avg_loss)))
+    rsi[pos < RSI_PERIOD] = np.nan
+
+    momentum = np.full(n, np.nan)
+    momentum[MOMENTUM_PERIOD:] = closes[MOMENTUM_PERIOD:] - closes[:-MOMENTUM_PERIOD]
+    momentum = js_round2(momentum)
+    momentum[pos < MOMENTUM_PERIOD] = np.nan
+
+    # Expanding log-return statistics, seeded per stock from the stored running state
+    valid_return = (pos > 0) & is_new & (closes > 0) & (prev_close > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_return = np.where(valid_return, np.log(closes / prev_close), 0.0)
+
+    def group_cumsum(values):
+        totals = np.cumsum(values)
+        before_group = np.r_[0.0, totals][group_start]
+        return totals - before_group[group_of_row]
+
+    group_stock_ids = stock_ids[group_start]
+    initial = np.array(
+        [initial_states.get(stock_id, (0, 0.0, 0.0)) for stock_id in group_stock_ids], dtype=float
+    ).reshape(-1, 3)
+    count = group_cumsum(valid_return.astype(float)) + initial[group_of_row, 0]
+    total = group_cumsum(log_return) + initial[group_of_row, 1]
+    total_sq = group_cumsum(log_return * log_return) + initial[group_of_row, 2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (total_sq - total * total / count) / (count - 1)
+        volatility = np.sqrt(np.maximum(variance, 0.0)) * np.sqrt(TRADING_DAYS) * 100
+    volatility[count < 2] = np.nan
+
+    return {
+        'daily_pct_change': daily_pct_change,
+        'sma20': sma20,
+        'sma50': sma50,
+        'rsi14': rsi,
+        'momentum10': momentum,
+        'volatility': volatility,
+        'log_return_count': count,
+        'log_return_sum': total,
+        'log_return_sumsq': total_sq,
+    }
+
+def upsert_features(connection, rows):
+    """Upserts feature row tuples into stocksdailyfeature in multi-row batches, one transaction."""
+    if not rows:
+        return
+    placeholders = "(" + ", ".join(["%s"] * len(FEATURE_COLUMNS)) + ")"
+    columns = ", ".join(f"`{column}`" for column in FEATURE_COLUMNS)
+    updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in FEATURE_COLUMNS[2:])
+
+    cursor = connection.cursor()
+    try:
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            chunk = rows[start:start + WRITE_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO stocksdailyfeature ({columns}) VALUES {', '.join([placeholders] * len(chunk))} "
+                f"ON DUPLICATE KEY UPDATE {updates}",
+                [value for row in chunk for value in row]
+            )
+        connection.commit()
+        print(f"Successfully upserted {len(rows)} feature rows.")
+    except Error as e:
+        print(f"Error during feature upsert: {e}")
+        connection.rollback()
+    finally:
+        cursor.close()
+
+def materialize_features(connection, full=False):
+    """Computes features for all bars not yet in stocksdailyfeature and stores them."""
+    try:
+        states = {} if full else fetch_feature_states(connection)
+        price_rows = fetch_price_window(connection, full=full)
+    except Error as e:
+        print(f"Error loading prices for feature computation: {e}")
+        return
+
+    if not price_rows:
+        print("No prices to compute features for.")
+        return
+
+    stock_ids = np.fromiter((row[0] for row in price_rows), dtype=np.int64, count=len(price_rows))
+    closes = np.fromiter((float(row[2]) for row in price_rows), dtype=np.float64, count=len(price_rows))
+    dates = [row[1] for row in price_rows]
+    last_dates = {stock_id: state[0] for stock_id, state in states.items()}
+    is_new = np.fromiter(
+        (last_dates.get(row[0]) is None or row[1] > last_dates[row[0]] for row in price_rows),
+        dtype=bool, count=len(price_rows)
+    )
+    initial_states = {stock_id: tuple(state[1:]) for stock_id, state in states.items()}
+
+    features = compute_features(stock_ids, closes, is_new, initial_states)
+
+    def value(column, i):
+        v = features[column][i]
+        return None if np.isnan(v) else float(v)
+
+    rows = [
+        (
+            int(stock_ids[i]), dates[i],
+            value('daily_pct_change', i), value('sma20', i), value('sma50', i),
+            value('rsi14', i), value('momentum10', i), value('volatility', i),
+            int(features['log_return_count'][i]),
+            float(features['log_return_sum'][i]),
+            float(features['log_return_sumsq'][i]),
+        )
+        for i in np.flatnonzero(is_new)
+    ]
+    print(f"Computed features for {len(rows)} new bars across {len(np.unique(stock_ids[is_new]))} stocks.")
+    upsert_features(connection, rows)
+
+def main():
+    """Computes features for new bars (or all bars with --full) using the .env database settings."""
+    parser = argparse.ArgumentParser(description="Materialize derived price features into stocksdailyfeature.")
+    parser.add_argument('--full', action='store_true', help="Recompute features for the full price history.")
+    args = parser.parse_args()
+
+    from populate_daily_prices import create_db_connection
+
+    db_connection = create_db_connection()
+    if not db_connection:
+        return
+    materialize_features(db_connection, full=args.full)
+    db_connection.close()
+
+if __name__ == "__main__":
+    main()
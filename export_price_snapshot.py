@@ -0,0 +1,351 @@
+# export_price_snapshot.py
+#
+# Exports stocksdailyprice into a compact columnar snapshot for modeling, so the
+# AI side reads an ordered, gap-checked dataset without touching MySQL or any API.
+#
+# Layout of a snapshot version directory:
+#   date.i32                  date ordinals (datetime.date.toordinal())
+#   open.f64 ... adj_close.f64 float64 prices
+#   volume.i64, adj_volume.i64 int64 volumes
+#   index.json                per-symbol stock_id, offset and length into the columns
+#   gaps.json                 per-symbol trading-day gap report
+# Rows are grouped by stock and sorted by date within each stock. The snapshot
+# directory holds numbered versions and a CURRENT file naming the live one, so
+# readers never see a half-written export.
+#
+# Each export only pulls rows newer than what the current version already holds
+# (plus the full history of symbols new to the snapshot) and merges them in.
+#
+# Required packages:
+# pip install mysql-connector-python python-dotenv numpy
+#
+# It runs automatically at the end of populate_daily_prices.py, or on its own:
+# python export_price_snapshot.py [--full] [--dir PATH]
+#
+# To read it:
+#   snapshot = PriceSnapshot()
+#   window = snapshot.window('AAPL', date(2024, 1, 1), date(2024, 6, 30))
+#   window['close']  # zero-copy numpy view
+
+import argparse
+import json
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+from mysql.connector import Error
+
+from trading_calendar import holidays_between
+
+DEFAULT_SNAPSHOT_DIR = os.getenv('PRICE_SNAPSHOT_DIR', 'data/price_snapshot')
+FETCH_CHUNK_SIZE = 50000
+KEEP_VERSIONS = 2  # the live version and the one before it
+
+COLUMNS = {
+    'date': np.int32,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'adj_open': np.float64,
+    'adj_high': np.float64,
+    'adj_low': np.float64,
+    'adj_close': np.float64,
+    'volume': np.int64,
+    'adj_volume': np.int64,
+}
+FLOAT_COLUMNS = [name for name, dtype in COLUMNS.items() if dtype == np.float64]
+INT_COLUMNS = ['volume', 'adj_volume']
+
+# MySQL TO_DAYS() counts from year 0; Python ordinals start at 0001-01-01 = 1
+TO_DAYS_OFFSET = 365
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _column_file(name):
+    return f"{name}.{'i32' if COLUMNS[name] == np.int32 else 'i64' if COLUMNS[name] == np.int64 else 'f64'}"
+
+def current_version_dir(snapshot_dir):
+    """Returns the live version directory, or None if nothing has been exported yet."""
+    try:
+        with open(os.path.join(snapshot_dir, 'CURRENT')) as f:
+            return os.path.join(snapshot_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+class PriceSnapshot:
+    """
+    Read-only, memory-mapped view of the live snapshot version.
+
+    Columns are opened with numpy.memmap, so slicing a symbol or date window returns
+    views into the mapped files without copying.
+    """
+
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        version_dir = current_version_dir(snapshot_dir)
+        if version_dir is None:
+            raise FileNotFoundError(f"No price snapshot found in {snapshot_dir}")
+        with open(os.path.join(version_dir, 'index.json')) as f:
+            self.index = json.load(f)['symbols']
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(version_dir, _column_file(name))
+            # numpy cannot map an empty file
+            self.columns[name] = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.empty(0, dtype)
+        gaps_path = os.path.join(version_dir, 'gaps.json')
+        self.gaps_path = gaps_path if os.path.exists(gaps_path) else None
+
+    @property
+    def symbols(self):
+        return sorted(self.index)
+
+    def window(self, symbol, start=None, end=None):
+        """
+        Returns a dict of column views for `symbol` with start <= date <= end.
+        `start` and `end` are datetime.date or None for an open bound.
+        """
+        entry = self.index[symbol]
+        offset, length = entry['offset'], entry['length']
+        dates = self.columns['date'][offset:offset + length]
+        lo = 0 if start is None else int(np.searchsorted(dates, start.toordinal(), side='left'))
+        hi = length if end is None else int(np.searchsorted(dates, end.toordinal(), side='right'))
+        return {name: column[offset + lo:offset + hi] for name, column in self.columns.items()}
+
+    def dates(self, symbol, start=None, end=None):
+        """Returns the window's dates as numpy datetime64[D] values."""
+        ordinals = self.window(symbol, start, end)['date']
+        return (ordinals.astype(np.int64) - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+
+    def gap_report(self):
+        """Returns the per-symbol gap report written with this version."""
+        if self.gaps_path is None:
+            return {}
+        with open(self.gaps_path) as f:
+            return json.load(f)
+
+def fetch_symbols(connection):
+    """Returns a dict mapping stock_id to symbol for every stock."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id, symbol FROM stocks")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+def fetch_new_rows(connection, watermarks, full_stock_ids):
+    """
+    Fetches each stock's price rows newer than its entry in `watermarks` (a dict mapping
+    stock_id to the last exported date ordinal), plus every row of the stocks in
+    `full_stock_ids`, as numpy arrays sorted by stock and date. With watermarks=None the
+    whole table is fetched. Values are cast in SQL so the connector never builds Decimal
+    or date objects.
+    """
+    select_columns = ", ".join(
+        ["p.stock_id", f"TO_DAYS(p.`date`) - {TO_DAYS_OFFSET}"]
+        + [f"CAST(p.`{name}` AS DOUBLE)" for name in FLOAT_COLUMNS]
+        + [f"p.`{name}`" for name in INT_COLUMNS]
+    )
+    if watermarks is None:
+        query = f"SELECT {select_columns} FROM stocksdailyprice p ORDER BY p.stock_id, p.`date`"
+        params = []
+    else:
+        # Joined per stock so one lagging symbol does not pull everyone's rows since its watermark
+        parts = [
+            f"SELECT {select_columns} FROM snapshot_watermark w "
+            "JOIN stocksdailyprice p ON p.stock_id = w.stock_id AND p.`date` > w.last_date"
+        ]
+        params = []
+        if full_stock_ids:
+            parts.append(
+                f"SELECT {select_columns} FROM stocksdailyprice p "
+                f"WHERE p.stock_id IN ({', '.join(['%s'] * len(full_stock_ids))})"
+            )
+            params.extend(full_stock_ids)
+        query = " UNION ALL ".join(parts) + " ORDER BY 1, 2"
+
+    cursor = connection.cursor()
+    chunks = []
+    try:
+        if watermarks is not None:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS snapshot_watermark")
+            cursor.execute(
+                "CREATE TEMPORARY TABLE snapshot_watermark (stock_id INT PRIMARY KEY, last_date DATE NOT NULL)"
+            )
+            watermark_rows = [(stock_id, date.fromordinal(ordinal)) for stock_id, ordinal in watermarks.items()]
+            for start in range(0, len(watermark_rows), FETCH_CHUNK_SIZE):
+                cursor.executemany(
+                    "INSERT INTO snapshot_watermark (stock_id, last_date) VALUES (%s, %s)",
+                    watermark_rows[start:start + FETCH_CHUNK_SIZE]
+                )
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+        if watermarks is not None:
+            cursor.execute("DROP TEMPORARY TABLE snapshot_watermark")
+    finally:
+        cursor.close()
+
+    table = np.concatenate(chunks) if chunks else np.empty((0, len(COLUMNS) + 1))
+    # adj_* columns are nullable; fall back to the unadjusted value like the ingestion does
+    data = {'stock_id': table[:, 0].astype(np.int64)}
+    names = ['date'] + FLOAT_COLUMNS + INT_COLUMNS
+    for i, name in enumerate(names, start=1):
+        data[name] = table[:, i]
+    for adjusted in ('adj_open', 'adj_high', 'adj_low', 'adj_close', 'adj_volume'):
+        missing = np.isnan(data[adjusted])
+        data[adjusted][missing] = data[adjusted[4:]][missing]
+    return {name: values.astype(COLUMNS.get(name, np.int64)) for name, values in data.items()}
+
+def build_gap_report(index, date_column, as_of):
+    """
+    For each symbol, lists runs of trading days missing between its first and last
+    stored dates, and how many trading days it trails `as_of`.
+    """
+    report = {}
+    if not index:
+        return report
+    first_year = date.fromordinal(int(date_column.min())).year if len(date_column) else as_of.year
+    holidays = np.array(holidays_between(first_year, as_of.year), dtype='datetime64[D]')
+    as_of_day = np.datetime64(as_of, 'D')
+
+    for symbol, entry in index.items():
+        offset, length = entry['offset'], entry['length']
+        if length == 0:
+            continue
+        days = (date_column[offset:offset + length].astype(np.int64) - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+        missing = np.busday_count(days[:-1] + 1, days[1:], holidays=holidays)
+        gap_at = np.flatnonzero(missing > 0)
+        report[symbol] = {
+            'first_date': str(days[0]),
+            'last_date': str(days[-1]),
+            'rows': int(length),
+            'missing_trading_days': int(missing.sum()),
+            'trading_days_behind': int(max(0, np.busday_count(days[-1] + 1, as_of_day + 1, holidays=holidays))),
+            'gaps': [
+                {'after': str(days[i]), 'before': str(days[i + 1]), 'missing': int(missing[i])}
+                for i in gap_at
+            ],
+        }
+    return report
+
+def export_snapshot(connection, snapshot_dir=DEFAULT_SNAPSHOT_DIR, full=False):
+    """Exports new price rows into a new snapshot version and makes it current."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = None
+    previous_dir = None if full else current_version_dir(snapshot_dir)
+    if previous_dir is not None:
+        previous = PriceSnapshot(snapshot_dir)
+
+    try:
+        symbols_by_id = fetch_symbols(connection)
+        old_by_id = {entry['stock_id']: (symbol, entry) for symbol, entry in previous.index.items()} if previous else {}
+        new_ids = sorted(set(symbols_by_id) - set(old_by_id))
+        watermarks = {stock_id: entry['last_date'] for stock_id, (_, entry) in old_by_id.items()} if previous else None
+        new = fetch_new_rows(connection, watermarks, new_ids)
+    except Error as e:
+        print(f"Error loading prices for the snapshot export: {e}")
+        return
+
+    # Per stock: new rows are those after the symbol's last exported date
+    new_starts = np.flatnonzero(np.r_[True, new['stock_id'][1:] != new['stock_id'][:-1]]) if len(new['stock_id']) else []
+    new_bounds = np.r_[new_starts, len(new['stock_id'])].astype(int)
+    new_ranges = {}
+    for i in range(len(new_bounds) - 1):
+        lo, hi = new_bounds[i], new_bounds[i + 1]
+        stock_id = int(new['stock_id'][lo])
+        if stock_id in old_by_id:
+            lo += int(np.searchsorted(new['date'][lo:hi], old_by_id[stock_id][1]['last_date'], side='right'))
+        new_ranges[stock_id] = (lo, hi)
+
+    # Lay out the merged version: old rows of each symbol followed by its new rows
+    layout = []
+    offset = 0
+    for stock_id, symbol in sorted(symbols_by_id.items()):
+        old_length = old_by_id[stock_id][1]['length'] if stock_id in old_by_id else 0
+        lo, hi = new_ranges.get(stock_id, (0, 0))
+        length = old_length + (hi - lo)
+        if length == 0:
+            continue
+        layout.append((symbol, stock_id, offset, old_length, lo, hi))
+        offset += length
+    total_rows = offset
+    added_rows = sum(hi - lo for _, _, _, _, lo, hi in layout)
+
+    unchanged_symbols = all(old_by_id.get(stock_id, (None,))[0] == symbol for symbol, stock_id, *_ in layout)
+    if previous is not None and added_rows == 0 and len(layout) == len(old_by_id) and unchanged_symbols:
+        print("Price snapshot is up to date.")
+        return
+
+    version = max([int(name[1:]) for name in os.listdir(snapshot_dir) if name.startswith('v') and name[1:].isdigit()] or [0]) + 1
+    version_name = f"v{version}"
+    version_dir = os.path.join(snapshot_dir, version_name)
+    os.makedirs(version_dir)
+
+    index = {}
+    for name, dtype in COLUMNS.items():
+        path = os.path.join(version_dir, _column_file(name))
+        if total_rows == 0:
+            open(path, 'wb').close()
+            continue
+        out = np.memmap(path, dtype=dtype, mode='w+', shape=(total_rows,))
+        for symbol, stock_id, start, old_length, lo, hi in layout:
+            if old_length:
+                old_offset = old_by_id[stock_id][1]['offset']
+                out[start:start + old_length] = previous.columns[name][old_offset:old_offset + old_length]
+            out[start + old_length:start + old_length + (hi - lo)] = new[name][lo:hi]
+        out.flush()
+        del out
+
+    dates = np.memmap(os.path.join(version_dir, _column_file('date')), dtype=np.int32, mode='r') if total_rows else np.empty(0, np.int32)
+    for symbol, stock_id, start, old_length, lo, hi in layout:
+        length = old_length + (hi - lo)
+        index[symbol] = {
+            'stock_id': int(stock_id),
+            'offset': int(start),
+            'length': int(length),
+            'first_date': int(dates[start]),
+            'last_date': int(dates[start + length - 1]),
+        }
+
+    as_of = date.today()
+    with open(os.path.join(version_dir, 'gaps.json'), 'w') as f:
+        json.dump(build_gap_report(index, dates, as_of), f)
+    with open(os.path.join(version_dir, 'index.json'), 'w') as f:
+        json.dump({'rows': int(total_rows), 'as_of': as_of.isoformat(), 'symbols': index}, f)
+    del dates
+
+    # Switch readers to the new version atomically, then prune old versions
+    current_tmp = os.path.join(snapshot_dir, 'CURRENT.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(version_name)
+    os.replace(current_tmp, os.path.join(snapshot_dir, 'CURRENT'))
+    versions = sorted(
+        (int(name[1:]) for name in os.listdir(snapshot_dir) if name.startswith('v') and name[1:].isdigit()),
+        reverse=True
+    )
+    for old_version in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(os.path.join(snapshot_dir, f"v{old_version}"), ignore_errors=True)
+
+    print(f"Exported price snapshot {version_name}: {total_rows} rows for {len(index)} symbols "
+          f"({added_rows} new) to {snapshot_dir}.")
+
+def main():
+    """Exports new prices into the snapshot (or rebuilds it with --full) using the .env database settings."""
+    parser = argparse.ArgumentParser(description="Export stocksdailyprice into a memory-mapped columnar snapshot.")
+    parser.add_argument('--full', action='store_true', help="Rebuild the snapshot from the full price history.")
+    parser.add_argument('--dir', default=DEFAULT_SNAPSHOT_DIR, help="Snapshot directory (default: %(default)s).")
+    args = parser.parse_args()
+
+    from populate_daily_prices import create_db_connection
+
+    db_connection = create_db_connection()
+    if not db_connection:
+        return
+    export_snapshot(db_connection, args.dir, full=args.full)
+    db_connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# ingest_metrics.py
+#
+# Lightweight run instrumentation for the ingestion scripts (populate_daily_prices.py,
+# update_tickers.py):
+# - per-symbol, per-stage timings (quote, history, sentiment, upsert, linking, ...)
+# - counters for rows, bytes, retries and database round trips
+# - an audit record of every upstream API call (source, symbol, purpose, timestamp)
+#
+# Events are appended to a JSON-lines file as they happen. At the end of a run a
+# summary with p50/p95 per stage is printed and appended, and optionally written as
+# a Prometheus textfile (moneygoup_<job>.prom) for node_exporter's textfile collector.
+#
+# Recording is a perf_counter() pair and a buffered json.dumps per event, so it is
+# cheap enough to leave on for production runs.
+
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+DEFAULT_EVENTS_PATH = os.getenv('INGEST_METRICS_EVENTS', 'logs/ingest_events.jsonl')
+DEFAULT_TEXTFILE_DIR = os.getenv('INGEST_METRICS_TEXTFILE_DIR')  # e.g. /var/lib/node_exporter/textfile
+
+PROMETHEUS_PREFIX = 'moneygoup_ingest'
+SUMMARY_QUANTILES = (0.5, 0.95)
+
+def percentile(sorted_values, quantile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def write_file_atomic(path, content):
+    """Writes bytes to `path` through a temp file in the same directory and a rename."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+class RunMetrics:
+    """
+    Thread-safe collector for one run of an ingestion job.
+    With events_path=None nothing is written to disk; timings and counters are still
+    aggregated for the summary.
+    """
+
+    def __init__(self, job, events_path=None, textfile_dir=None):
+        self.job = job
+        self.run_id = f"{job}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.textfile_path = os.path.join(textfile_dir, f"moneygoup_{job}.prom") if textfile_dir else None
+        self.started = time.time()
+        self.stage_seconds = {}  # stage -> list of durations
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._events = None
+        if events_path:
+            directory = os.path.dirname(events_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._events = open(events_path, 'a', buffering=64 * 1024)
+        self.event('run_start')
+
+    def event(self, kind, **fields):
+        """Appends one JSON-lines event."""
+        if self._events is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 6), 'run': self.run_id, 'event': kind, **fields}, default=str)
+        with self._lock:
+            self._events.write(line + "\n")
+
+    def count(self, counter, value=1):
+        """Adds `value` to a run counter."""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def record(self, stage, seconds, symbol=None, **fields):
+        """Records a stage duration, optionally for one symbol."""
+        with self._lock:
+            self.stage_seconds.setdefault(stage, []).append(seconds)
+        if symbol is not None:
+            fields['symbol'] = symbol
+        self.event('stage', stage=stage, seconds=round(seconds, 6), **fields)
+
+    @contextmanager
+    def stage(self, stage, symbol=None, **fields):
+        """
+        Times the enclosed block as `stage`. Yields a dict whose entries are added to
+        the event, e.g. to report the rows a stage wrote.
+        """
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(stage, time.perf_counter() - started, symbol, **fields)
+
+    def api_call(self, purpose, url, symbol=None, status=None, seconds=None, response_bytes=None, error=None):
+        """Audits one upstream API call and counts it."""
+        source = urlparse(url).netloc
+        self.count('api_calls')
+        self.count(f"api_calls_{purpose}")
+        if response_bytes:
+            self.count('bytes', response_bytes)
+        self.event(
+            'api_call', source=source, symbol=symbol, purpose=purpose, url=url, status=status,
+            seconds=None if seconds is None else round(seconds, 6), bytes=response_bytes, error=error
+        )
+
+    def count_bytes(self, chunks):
+        """Passes byte chunks through while adding their size to the 'bytes' counter."""
+        total = 0
+        try:
+            for chunk in chunks:
+                total += len(chunk)
+                yield chunk
+        finally:
+            self.count('bytes', total)
+
+    def summary(self):
+        """Returns per-stage count/total/p50/p95 plus the counters."""
+        with self._lock:
+            stages = {stage: sorted(values) for stage, values in self.stage_seconds.items()}
+            counters = dict(self.counters)
+        return {
+            'run': self.run_id,
+            'job': self.job,
+            'duration_seconds': round(time.time() - self.started, 3),
+            'stages': {
+                stage: {
+                    'count': len(values),
+                    'total_seconds': round(sum(values), 6),
+                    'p50_seconds': round(percentile(values, 0.5), 6),
+                    'p95_seconds': round(percentile(values, 0.95), 6),
+                }
+                for stage, values in stages.items()
+            },
+            'counters': counters,
+        }
+
+    def report(self, summary=None):
+        """Prints the end-of-run summary."""
+        summary = summary or self.summary()
+        print(f"\nRun {summary['run']} finished in {summary['duration_seconds']:.1f}s")
+        for stage, stats in sorted(summary['stages'].items()):
+            print(f"  {stage:<16} n={stats['count']:<6} total={stats['total_seconds']:.3f}s "
+                  f"p50={stats['p50_seconds'] * 1000:.1f}ms p95={stats['p95_seconds'] * 1000:.1f}ms")
+        for counter, value in sorted(summary['counters'].items()):
+            print(f"  {counter:<16} {value}")
+
+    def write_textfile(self, summary):
+        """Writes the summary in the Prometheus text format, atomically."""
+        job = self.job
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent per pipeline stage in the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary",
+        ]
+        with self._lock:
+            stages = {stage: sorted(values) for stage, values in self.stage_seconds.items()}
+        for stage, values in sorted(stages.items()):
+            labels = f'job="{job}",stage="{stage}"'
+            for quantile in SUMMARY_QUANTILES:
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},quantile="{quantile}"}} {percentile(values, quantile)}')
+            lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_sum{{{labels}}} {sum(values)}")
+            lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_count{{{labels}}} {len(values)}")
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_run_counter Rows, bytes, retries, API calls and DB round trips in the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_counter gauge",
+        ]
+        for counter, value in sorted(summary['counters'].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_run_counter{{job="{job}",counter="{counter}"}} {value}')
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_run_duration_seconds Wall time of the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge",
+            f'{PROMETHEUS_PREFIX}_run_duration_seconds{{job="{job}"}} {summary["duration_seconds"]}',
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_timestamp_seconds Unix time the last run finished.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+            f'{PROMETHEUS_PREFIX}_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}',
+        ]
+
+        os.makedirs(os.path.dirname(self.textfile_path), exist_ok=True)
+        # The collector must never read a partial file
+        write_file_atomic(self.textfile_path, ("\n".join(lines) + "\n").encode('utf-8'))
+
+    def close(self):
+        """Reports the summary, writes it to the event log and the textfile, and closes the log."""
+        summary = self.summary()
+        self.report(summary)
+        self.event('run_summary', **summary)
+        if self.textfile_path:
+            try:
+                self.write_textfile(summary)
+            except OSError as e:
+                print(f"Error writing metrics textfile {self.textfile_path}: {e}")
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        return summary
+
+class CountingCursor:
+    """Cursor wrapper that counts every statement as a database round trip."""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, *args, **kwargs):
+        self._metrics.count('db_round_trips')
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        # mysql-connector rewrites INSERT ... VALUES batches into a single statement
+        self._metrics.count('db_round_trips')
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingConnection:
+    """Connection wrapper whose cursors, commits and rollbacks count database round trips."""
+
+    def __init__(self, connection, metrics):
+        self._connection = connection
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        self._metrics.count('db_round_trips')
+        return self._connection.commit()
+
+    def rollback(self):
+        self._metrics.count('db_round_trips')
+        return self._connection.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
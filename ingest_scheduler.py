@@ -0,0 +1,375 @@
+# ingest_scheduler.py
+#
+# Long-running scheduler for watchlist price refreshes (requirements stories 1.1,
+# 1.2, 1.3 and 2.5). Unlike a one-off populate_daily_prices.py run, it only
+# refreshes stocks that at least one user holds in user_stocks. Search-only
+# symbols are never fetched.
+#
+# The database connection, HTTP session, sentiment engine and response cache are
+# created once and kept warm between cycles (the connection is pinged while idle).
+# Cycles follow the NYSE/NASDAQ calendar in trading_calendar.py, in market time:
+# - daily: once per trading day after the close (--daily-at). It ingests the bars
+#   of that trading day for the watchlist stocks that do not have them yet.
+# - premarket (optional, --premarket or INGEST_PREMARKET_REFRESH=1): before the open
+#   of a trading day (--premarket-at). It refreshes every watchlist quote and fills
+#   any bars still missing for the previous trading day. Existing bars are never
+#   re-fetched, so daily data is not duplicated.
+# Completed cycles are recorded in --state-file, so a restart neither repeats a cycle
+# nor misses the last daily one.
+#
+# Each cycle builds its work set from one join of stocks and user_stocks, ordered
+# by staleness (no stored bars first, then the oldest last bar) and then by how
+# many users hold the stock. Quotes are fetched in multi-symbol batches
+# (--quote-batch-size). With --api-budget, stocks are taken in that order while
+# their estimated upstream calls fit the budget. The budget is also enforced
+# per request, so the most important symbols are refreshed first and the rest wait
+# for the next cycle.
+#
+# Required packages:
+# pip install mysql-connector-python python-dotenv requests
+#
+# To run:
+# python ingest_scheduler.py [--premarket] [--api-budget 500] [--once]
+
+import os
+import argparse
+import json
+import math
+import signal
+import threading
+from datetime import datetime, time as clock_time
+from functools import partial
+from zoneinfo import ZoneInfo
+
+from mysql.connector import Error
+
+from compute_features import materialize_features
+from export_price_snapshot import export_snapshot
+from ingest_metrics import CountingConnection, RunMetrics, write_file_atomic
+from populate_daily_prices import (
+    MAX_QUOTE_BATCH_SIZE, ApiBudget, BulkPriceWriter, NewsWriter, QuoteBatcher, RateLimiter, add_pipeline_arguments,
+    create_db_connection, create_http_session, fetch_unjournaled_stock_data, ingest_stocks
+)
+from run_journal import DEFAULT_JOURNAL_PATH, ResponseCache, RunJournal
+from sentiment_engine import SentimentEngine
+from trading_calendar import next_trading_day, previous_trading_day
+
+MARKET_TZ = ZoneInfo(os.getenv('INGEST_MARKET_TZ', 'America/New_York'))
+MARKET_OPEN = clock_time(9, 30)
+DEFAULT_DAILY_AT = os.getenv('INGEST_DAILY_AT', '17:00')  # market time, after the close has settled
+DEFAULT_PREMARKET_AT = os.getenv('INGEST_PREMARKET_AT', '08:00')
+DEFAULT_PREMARKET = os.getenv('INGEST_PREMARKET_REFRESH', '0') == '1'
+DEFAULT_API_BUDGET = int(os.getenv('INGEST_API_BUDGET', '0'))  # upstream requests per cycle, 0 for no limit
+DEFAULT_STATE_PATH = os.getenv('INGEST_SCHEDULER_STATE', '.ingest_scheduler_state.json')
+KEEPALIVE_INTERVAL = 300  # seconds between database pings while idle
+CYCLE_RETRY_DELAY = 60  # seconds before a failed cycle is run again
+
+# One row per watchlist stock, with its holders and its last stored bar
+WORK_SET_QUERY = """
+    SELECT s.id, s.symbol, s.company_name,
+           COUNT(*) AS holders,
+           GROUP_CONCAT(us.user_id) AS user_ids,
+           latest.last_date,
+           sdp.`close` AS last_close
+    FROM stocks s
+    JOIN user_stocks us ON us.stock_id = s.id
+    LEFT JOIN (
+        SELECT stock_id, MAX(`date`) AS last_date
+        FROM stocksdailyprice
+        GROUP BY stock_id
+    ) latest ON latest.stock_id = s.id
+    LEFT JOIN stocksdailyprice sdp ON sdp.stock_id = s.id AND sdp.`date` = latest.last_date
+    GROUP BY s.id, s.symbol, s.company_name, latest.last_date, sdp.`close`
+    ORDER BY latest.last_date IS NOT NULL, latest.last_date, holders DESC, s.symbol
+"""
+
+def parse_clock(value):
+    """argparse type for a HH:MM time of day."""
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HH:MM, got {value!r}")
+
+def load_state(state_path):
+    """Returns {cycle kind: ISO date of the last trading day it completed for}, or {}."""
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state_path, state):
+    write_file_atomic(state_path, json.dumps(state).encode('utf-8'))
+
+def next_cycle(now, state, daily_at, premarket_at=None):
+    """
+    Returns the next cycle to run as (kind, trading day, due datetime); the due time
+    may be in the past if the cycle is overdue. Only the latest overdue daily cycle
+    is caught up, and a premarket cycle is dropped once the market has opened.
+    """
+    today = now.date()
+    day = previous_trading_day(today)
+    slots = []
+    # The previous trading day, today if it trades, and the next trading day
+    for _ in range(3):
+        if premarket_at is not None:
+            slots.append(('premarket', day, datetime.combine(day, premarket_at, MARKET_TZ)))
+        slots.append(('daily', day, datetime.combine(day, daily_at, MARKET_TZ)))
+        day = next_trading_day(day)
+
+    overdue_daily = [due for kind, _, due in slots if kind == 'daily' and due <= now]
+    for kind, day, due in slots:
+        if state.get(kind, '') >= day.isoformat():
+            continue
+        if kind == 'premarket' and now >= datetime.combine(day, MARKET_OPEN, MARKET_TZ):
+            continue
+        if kind == 'daily' and due <= now and due != overdue_daily[-1]:
+            continue
+        return kind, day, due
+    raise RuntimeError("No cycle found in the next trading days")  # unreachable with valid state
+
+def fetch_work_set(connection):
+    """
+    Fetches every stock held by at least one user, most stale first and then most
+    held first, with its holders and last stored bar. Database errors are raised, so
+    the cycle fails and runs again instead of finding an empty watchlist.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # The default of 1024 bytes would truncate the holders of widely held stocks
+        cursor.execute("SET SESSION group_concat_max_len = 1048576")
+        cursor.execute(WORK_SET_QUERY)
+        work_set = cursor.fetchall()
+        print(f"Found {len(work_set)} watchlist stocks.")
+        return work_set
+    finally:
+        cursor.close()
+
+def plan_cycle(work_set, target_day, kind, api_budget, quote_batch_size=1):
+    """
+    Picks the stocks of a cycle in priority order. The daily cycle skips stocks that
+    already have the bar of `target_day`; the premarket cycle refreshes every quote.
+    Quotes cost one request per `quote_batch_size` stocks, plus one history request
+    per stock with stale bars; with an api_budget, stocks are taken until the next
+    one no longer fits. Returns (planned stocks, deferred stocks).
+    """
+    planned = []
+    deferred = []
+    history_requests = 0
+    for stock in work_set:
+        stale = stock['last_date'] is None or stock['last_date'] < target_day
+        if kind == 'daily' and not stale:
+            continue
+        cost = history_requests + stale + math.ceil((len(planned) + 1) / max(1, quote_batch_size))
+        if deferred or (api_budget > 0 and cost > api_budget):
+            deferred.append(stock)
+            continue
+        history_requests += stale
+        planned.append(stock)
+    return planned, deferred
+
+class IngestScheduler:
+    """
+    Runs daily and premarket cycles over the watchlist on a warm database
+    connection, HTTP session and sentiment engine.
+    """
+
+    def __init__(self, args, connection, stop_event):
+        self.args = args
+        self.connection = connection
+        self.stop_event = stop_event
+        self.workers = max(1, args.workers)
+        self.session = create_http_session(self.workers)
+        self.limiter = RateLimiter(args.rate_limit, args.burst)
+        self.sentiment_engine = SentimentEngine(args.sentiment_cache, args.sentiment_cache_size, args.sentiment_workers)
+        self.cache = ResponseCache(args.cache_dir, args.cache_ttl)
+        self.journal = RunJournal(args.journal)
+        self.state = load_state(args.state_file)
+
+    def wait_until(self, due):
+        """Sleeps until `due`, pinging the database to keep the connection open. False if stopped."""
+        while True:
+            remaining = (due - datetime.now(MARKET_TZ)).total_seconds()
+            if remaining <= 0:
+                return True
+            if self.stop_event.wait(min(remaining, KEEPALIVE_INTERVAL)):
+                return False
+            try:
+                self.connection.ping(reconnect=True, attempts=3, delay=5)
+            except Error as e:
+                print(f"Error pinging the database: {e}")
+
+    def run_cycle(self, kind, day):
+        """Runs one cycle for a trading day and records it as completed."""
+        args = self.args
+        # A premarket cycle completes the bars of the previous session
+        target_day = day if kind == 'daily' else previous_trading_day(day)
+        metrics = RunMetrics('ingest_scheduler', args.metrics_events, args.metrics_textfile_dir)
+        metrics.event('cycle', cycle=kind, day=day, target_day=target_day)
+        print(f"\nStarting the {kind} cycle for {day} (bars through {target_day}).")
+        try:
+            connection = CountingConnection(self.connection, metrics)
+
+            work_set = fetch_work_set(connection)
+            quote_batch_size = min(args.quote_batch_size, MAX_QUOTE_BATCH_SIZE)
+            planned, deferred = plan_cycle(work_set, target_day, kind, args.api_budget, quote_batch_size)
+            print(f"Refreshing {len(planned)} stocks, {len(work_set) - len(planned) - len(deferred)} are up to date.")
+            if deferred:
+                print(f"The API budget of {args.api_budget} requests defers {len(deferred)} stocks to the next cycle: "
+                      f"{', '.join(stock['symbol'] for stock in deferred)}")
+                metrics.count('symbols_deferred', len(deferred))
+
+            failed = []
+            if planned:
+                user_stocks = [
+                    {'user_id': int(user_id), 'stock_id': stock['id']}
+                    for stock in planned for user_id in stock['user_ids'].split(',')
+                ]
+                watermarks = {stock['id']: (stock['last_date'], stock['last_close']) for stock in planned}
+                budget = ApiBudget(self.limiter, args.api_budget) if args.api_budget > 0 else None
+                limiter = budget or self.limiter
+                if self.cache.enabled:
+                    self.cache.prune()
+                self.journal.start(metrics.run_id, {'kind': kind, 'day': day})
+                price_writer = BulkPriceWriter(connection, metrics, args.batch_size, args.flush_interval, journal=self.journal)
+                news_writer = NewsWriter(
+                    connection, metrics, user_stocks, args.news_batch_size, self.sentiment_engine, self.journal
+                )
+                quotes = None
+                if quote_batch_size > 1:
+                    quotes = QuoteBatcher(self.session, limiter, metrics, quote_batch_size, self.workers, self.cache)
+                fetch = partial(
+                    fetch_unjournaled_stock_data, self.session, limiter, metrics, self.journal, watermarks, target_day,
+                    self.cache, quotes.prices if quotes else None
+                )
+                failed = ingest_stocks(
+                    planned, fetch, price_writer, news_writer, metrics, self.journal, self.workers, args.retries,
+                    args.retry_backoff, budget=budget, quotes=quotes
+                )
+                news_writer.close()
+                self.journal.finish()
+                if failed:
+                    print(f"{len(failed)} symbols failed and are retried next cycle: "
+                          f"{', '.join(stock['symbol'] for stock in failed)}")
+                    metrics.count('symbols_failed', len(failed))
+
+                if not args.skip_features:
+                    with metrics.stage('features'):
+                        materialize_features(connection)
+                if not args.skip_snapshot:
+                    with metrics.stage('snapshot'):
+                        export_snapshot(connection, args.snapshot_dir)
+                self.sentiment_engine.report()
+
+            # Deferred and failed stocks are picked up first next cycle, as they stay the most stale
+            self.state[kind] = day.isoformat()
+            save_state(args.state_file, self.state)
+        finally:
+            metrics.close()
+
+    def run(self, once=False):
+        """Runs cycles as they come due until stopped; with once=True only a cycle that is already due."""
+        premarket_at = self.args.premarket_at if self.args.premarket else None
+        while not self.stop_event.is_set():
+            kind, day, due = next_cycle(datetime.now(MARKET_TZ), self.state, self.args.daily_at, premarket_at)
+            if once and due > datetime.now(MARKET_TZ):
+                print(f"No cycle is due; the next is the {kind} cycle for {day} at {due:%Y-%m-%d %H:%M %Z}.")
+                return
+            print(f"Next: the {kind} cycle for {day} at {due:%Y-%m-%d %H:%M %Z}.")
+            if not self.wait_until(due):
+                return
+            try:
+                self.run_cycle(kind, day)
+            except Exception as e:
+                # The cycle is not recorded as completed, so it comes due again right away
+                print(f"The {kind} cycle for {day} failed: {e}")
+                self.reconnect()
+                if once or self.stop_event.wait(CYCLE_RETRY_DELAY):
+                    return
+                continue
+            if once:
+                return
+
+    def reconnect(self):
+        """Reopens the database connection after a failed cycle; the next cycle reports it if still down."""
+        try:
+            self.connection.reconnect(attempts=3, delay=5)
+            print("Reconnected to the database.")
+        except Error as e:
+            print(f"Error reconnecting to the database: {e}")
+
+    def close(self):
+        self.journal.close()
+        self.sentiment_engine.close()
+        self.session.close()
+
+def parse_args():
+    """Parses command line options."""
+    parser = argparse.ArgumentParser(description="Refresh watchlist prices on the trading-day schedule.")
+    parser.add_argument(
+        '--daily-at',
+        type=parse_clock,
+        default=parse_clock(DEFAULT_DAILY_AT),
+        help=f"Market time (HH:MM) of the daily ingest on trading days (default: {DEFAULT_DAILY_AT})."
+    )
+    parser.add_argument(
+        '--premarket',
+        action=argparse.BooleanOptionalAction,
+        default=DEFAULT_PREMARKET,
+        help="Also refresh prices before the open of every trading day (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--premarket-at',
+        type=parse_clock,
+        default=parse_clock(DEFAULT_PREMARKET_AT),
+        help=f"Market time (HH:MM) of the premarket refresh (default: {DEFAULT_PREMARKET_AT})."
+    )
+    parser.add_argument(
+        '--api-budget',
+        type=int,
+        default=DEFAULT_API_BUDGET,
+        help="Maximum upstream API requests per cycle, 0 for no limit (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help="Run the cycle that is due now, if any, and exit instead of running as a daemon."
+    )
+    parser.add_argument(
+        '--state-file',
+        default=DEFAULT_STATE_PATH,
+        help="File recording the last completed cycles (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--journal',
+        default=f"{DEFAULT_JOURNAL_PATH}.scheduler",
+        help="SQLite file of the cycle journal (default: %(default)s)."
+    )
+    add_pipeline_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    """Connects once and runs the scheduler until SIGINT/SIGTERM (or one cycle with --once)."""
+    args = parse_args()
+    connection = create_db_connection()
+    if not connection:
+        return
+
+    stop_event = threading.Event()
+    def stop(signum, frame):
+        # A running cycle finishes first
+        print(f"Received signal {signum}, stopping after the current cycle.")
+        stop_event.set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    scheduler = IngestScheduler(args, connection, stop_event)
+    try:
+        scheduler.run(once=args.once)
+    finally:
+        scheduler.close()
+        connection.close()
+    print("Scheduler stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,37 @@
 /*!40101 SET @OLD_SQL_MODE=@@SQL_MODE, SQL_MODE='NO_AUTO_VALUE_ON_ZERO' */;
 /*!40111 SET @OLD_SQL_NOTES=@@SQL_NOTES, SQL_NOTES=0 */;
 
+--
+-- Table structure for table `ingest_lease`
+--
+
+DROP TABLE IF EXISTS `ingest_lease`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `ingest_lease` (
+  `cycle` varchar(32) NOT NULL,
+  `stock_id` int NOT NULL,
+  `shard` int NOT NULL,
+  `owner` varchar(64) DEFAULT NULL,
+  `lease_until` datetime DEFAULT NULL,
+  `attempts` int NOT NULL DEFAULT '0',
+  `completed_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`cycle`,`stock_id`),
+  KEY `cycle_shard` (`cycle`,`shard`),
+  KEY `stock_id` (`stock_id`),
+  CONSTRAINT `ingest_lease_ibfk_1` FOREIGN KEY (`stock_id`) REFERENCES `stocks` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `ingest_lease`
+--
+
+LOCK TABLES `ingest_lease` WRITE;
+/*!40000 ALTER TABLE `ingest_lease` DISABLE KEYS */;
+/*!40000 ALTER TABLE `ingest_lease` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `news`
 --
@@ -114,6 +145,39 @@ INSERT INTO `stocksdailyprice` VALUES (4271,4,'2025-01-24',93.54,95.01,93.46,94.
 /*!40000 ALTER TABLE `stocksdailyprice` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `stocksdailyfeature`
+--
+
+DROP TABLE IF EXISTS `stocksdailyfeature`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `stocksdailyfeature` (
+  `stock_id` int NOT NULL,
+  `date` date NOT NULL,
+  `daily_pct_change` double DEFAULT NULL,
+  `sma20` double DEFAULT NULL,
+  `sma50` double DEFAULT NULL,
+  `rsi14` double DEFAULT NULL,
+  `momentum10` double DEFAULT NULL,
+  `volatility` double DEFAULT NULL,
+  `log_return_count` int NOT NULL DEFAULT '0',
+  `log_return_sum` double NOT NULL DEFAULT '0',
+  `log_return_sumsq` double NOT NULL DEFAULT '0',
+  PRIMARY KEY (`stock_id`,`date`),
+  CONSTRAINT `stocksdailyfeature_ibfk_1` FOREIGN KEY (`stock_id`) REFERENCES `stocks` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `stocksdailyfeature`
+--
+
+LOCK TABLES `stocksdailyfeature` WRITE;
+/*!40000 ALTER TABLE `stocksdailyfeature` DISABLE KEYS */;
+/*!40000 ALTER TABLE `stocksdailyfeature` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `user_stock_news`
 --
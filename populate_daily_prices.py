@@ -9,14 +9,84 @@
 # To run the script:
 # 1. Make sure your local development server is running.
 # 2. Run the script from your terminal: python populate_daily_prices.py
+#
+# By default only the bars after each stock's last stored date are fetched and
+# upserted. Stocks with no stored prices always get their full history. Pass
+# --full-backfill to re-pull and re-upsert the full history for every stock.
+#
+# Quote and history requests run on a thread pool (--workers) over a shared
+# keep-alive session, throttled by a per-host token bucket (--rate-limit,
+# --burst). All database writes happen on the main thread in completion order.
+#
+# Price rows are buffered across stocks and flushed in multi-row upserts
+# (--batch-size, --flush-interval). With --load-data, full-history backfills are
+# streamed through a staging table with LOAD DATA LOCAL INFILE instead.
+# Historical responses are parsed incrementally and handed to the writer in
+# fixed-size chunks, so memory stays flat however long a symbol's history is.
+#
+# Articles already stored with a sentiment score are not re-scored or re-upserted;
+# the rest are scored by sentiment_engine.py with an on-disk memo cache
+# (--sentiment-cache, --sentiment-cache-size) and a process pool (--sentiment-workers).
+#
+# After prices are written, compute_features.py materializes SMA/RSI/momentum/
+# volatility for the new bars into stocksdailyfeature (skip with --skip-features),
+# and export_price_snapshot.py appends them to the memory-mapped columnar
+# snapshot used for modeling (skip with --skip-snapshot).
+#
+# Every run is instrumented by ingest_metrics.py: per-symbol stage timings, row/byte/
+# retry/DB round-trip counters and an audit of every API call are appended as JSON
+# lines to --metrics-events, and a p50/p95 summary is printed at the end (and written
+# as a Prometheus textfile to --metrics-textfile-dir if set).
+#
+# Each stock's committed stages (price, history, news, links) are checkpointed in a
+# run journal (run_journal.py, --journal). An interrupted run is continued with
+# --resume, which skips the stages already done. Quote and history responses are
+# cached on disk per URL and day (--cache-dir, --cache-ttl), and symbols that fail
+# are retried with exponential backoff at the end of the pass (--retries,
+# --retry-backoff), mostly from that cache.
+#
+# Quotes are prefetched in multi-symbol requests to /api/stock/quote?symbols=...
+# (--quote-batch-size symbols each); a symbol falls back to /api/stock/quote/{symbol}
+# only if its batch request failed. --quotes-only refreshes just stocks.price for
+# every stock, writing each quote batch with one set-based UPDATE as it arrives.
+#
+# This script refreshes every row in stocks, once per invocation. The
+# watchlist-only, trading-calendar driven refreshes are run by ingest_scheduler.py,
+# which reuses its fetch and write stages.
+#
+# With --shard i/N several workers split the stocks between them, on one host or
+# many: stocks are hash-partitioned by symbol and claimed in batches through
+# expiring lease rows in ingest_lease (shard_lease.py, --claim-size,
+# --lease-seconds). Rows of a worker that stalls or dies are stolen by the others
+# once their own shard is done (unless --no-steal), and the last worker standing
+# runs the features and snapshot stages. --shard-status prints per-shard progress.
 
 import os
+import argparse
+import codecs
+import json
+import re
+import tempfile
+import threading
+import time
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlparse
 import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from textblob import TextBlob # For sentiment analysis
+from datetime import date, datetime, timedelta
+from compute_features import materialize_features
+from export_price_snapshot import DEFAULT_SNAPSHOT_DIR, export_snapshot
+from ingest_metrics import DEFAULT_EVENTS_PATH, DEFAULT_TEXTFILE_DIR, CountingConnection, RunMetrics
+from run_journal import DEFAULT_CACHE_DIR, DEFAULT_CACHE_TTL, DEFAULT_JOURNAL_PATH, ResponseCache, RunJournal
+from sentiment_engine import DEFAULT_CACHE_PATH, DEFAULT_CACHE_SIZE, SentimentEngine
+from shard_lease import (
+    DEFAULT_CLAIM_SIZE, DEFAULT_LEASE_SECONDS, ShardLease, default_cycle, parse_shard, print_shard_summary
+)
 
 # Disable SSL certificate verification for local development
 #os.environ['NODE_TLS_REJECT_UNAUTHORIZED'] = '0'
@@ -35,14 +105,134 @@ HEADERS = {
     "Origin": APP_HOST
 }
 
-def create_db_connection():
+# Fetch concurrency and upstream quota defaults, overridable from the command line
+DEFAULT_WORKERS = int(os.getenv('INGEST_WORKERS', '8'))
+DEFAULT_RATE_LIMIT = float(os.getenv('INGEST_RATE_LIMIT', '5'))  # requests per second, per host
+DEFAULT_BURST = int(os.getenv('INGEST_BURST', '10'))
+
+# Bulk write defaults for stocksdailyprice
+DEFAULT_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '5000'))  # rows per INSERT statement / flush
+DEFAULT_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '30'))  # seconds
+DEFAULT_STAGING_BATCH_SIZE = int(os.getenv('INGEST_STAGING_BATCH_SIZE', '200000'))  # rows per LOAD DATA merge
+
+# News stage batching
+DEFAULT_NEWS_BATCH_SIZE = int(os.getenv('INGEST_NEWS_BATCH_SIZE', '50'))  # stocks per news upsert
+NEWS_LOOKUP_CHUNK_SIZE = 1000  # links per id lookup query
+NEWS_LINK_CHUNK_SIZE = 5000  # rows per user_stock_news INSERT statement
+
+# Multi-symbol quote requests
+DEFAULT_QUOTE_BATCH_SIZE = int(os.getenv('INGEST_QUOTE_BATCH_SIZE', '50'))  # symbols per request
+MAX_QUOTE_BATCH_SIZE = 100  # the batch quote route's limit
+
+# Retries of failed symbols at the end of a pass
+DEFAULT_RETRIES = int(os.getenv('INGEST_RETRIES', '2'))
+DEFAULT_RETRY_BACKOFF = float(os.getenv('INGEST_RETRY_BACKOFF', '5'))  # seconds, doubled per attempt
+
+# Streaming history parse
+HISTORY_STREAM_CHUNK_BYTES = 64 * 1024
+HISTORY_CHUNK_ROWS = 1000  # rows handed to the price writer at a time
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiter keyed by host.
+    Each host refills at `rate` tokens per second up to `burst` tokens.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets = {}  # host -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Blocks until a request to the host of `url` is allowed."""
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last_refill = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last_refill) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+class ApiBudgetExhausted(requests.exceptions.RequestException):
+    """Raised instead of issuing a request once an ApiBudget is spent."""
+
+class ApiBudget:
+    """
+    Rate limiter wrapper that allows at most `budget` upstream requests, e.g. per
+    scheduler cycle. Requests beyond it raise ApiBudgetExhausted. Cached responses
+    do not go through the limiter, so they cost nothing.
+    """
+
+    def __init__(self, limiter, budget):
+        self.limiter = limiter
+        self.budget = budget
+        self.remaining = budget
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.remaining <= 0
+
+    def acquire(self, url):
+        with self._lock:
+            if self.remaining <= 0:
+                raise ApiBudgetExhausted(f"API budget of {self.budget} requests is spent")
+            self.remaining -= 1
+        self.limiter.acquire(url)
+
+def create_http_session(workers):
+    """Creates a requests session with a keep-alive connection pool sized for the fetch workers."""
+    # Pending results keep their streamed history responses open, so size the pool for them too
+    pool_size = workers * 2
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+def http_get(session, limiter, metrics, url, symbol=None, purpose=None, cache=None):
+    """
+    Issues a rate-limited, audited GET on the shared session and returns the decoded JSON body.
+    With a ResponseCache, a fresh cached body is returned without a request.
+    """
+    if cache is not None:
+        body = cache.read(url)
+        if body is not None:
+            metrics.count('cache_hits')
+            return json.loads(body)
+
+    limiter.acquire(url)
+    started = time.perf_counter()
+    try:
+        response = session.get(url)
+    except requests.exceptions.RequestException as e:
+        metrics.api_call(purpose, url, symbol, seconds=time.perf_counter() - started, error=str(e))
+        raise
+    metrics.api_call(purpose, url, symbol, response.status_code, time.perf_counter() - started, len(response.content))
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    data = response.json()
+    if cache is not None:
+        cache.put(url, response.content)
+    return data
+
+def create_db_connection(allow_local_infile=False):
     """Creates and returns a database connection."""
     try:
         connection = mysql.connector.connect(
             host=os.getenv('DB_HOST'),
             user=os.getenv('DB_USER'),
             password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_DATABASE')
+            database=os.getenv('DB_DATABASE'),
+            allow_local_infile=allow_local_infile
         )
         if connection.is_connected():
             print("Successfully connected to the database")
@@ -79,86 +269,327 @@ def fetch_user_stocks(connection):
     finally:
         cursor.close()
 
-def fetch_historical_data(symbol):
-    """Fetches historical stock data for a given stock symbol from the local API."""
+def fetch_price_watermarks(connection):
+    """
+    Fetches the last stored date and close for every stock in stocksdailyprice.
+    Returns a dict mapping stock_id to a (last_date, last_close) tuple.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT sdp.stock_id, sdp.`date` AS last_date, sdp.`close` AS last_close
+            FROM stocksdailyprice sdp
+            JOIN (
+                SELECT stock_id, MAX(`date`) AS max_date
+                FROM stocksdailyprice
+                GROUP BY stock_id
+            ) latest ON latest.stock_id = sdp.stock_id AND latest.max_date = sdp.`date`
+        """)
+        watermarks = {
+            row['stock_id']: (row['last_date'], row['last_close'])
+            for row in cursor.fetchall()
+        }
+        print(f"Found stored prices for {len(watermarks)} stocks.")
+        return watermarks
+    except Error as e:
+        print(f"Error fetching price watermarks: {e}")
+        return {}
+    finally:
+        cursor.close()
+
+# Returned by fetch_quote_price when the request failed, as opposed to None when the
+# API answered without a price; only a failed request is worth retrying
+QUOTE_FAILED = object()
+
+def fetch_quote_price(session, limiter, metrics, symbol, cache=None):
+    """
+    Fetches the real-time price for a given stock symbol from the local API.
+    Returns the price, None if the API has none, or QUOTE_FAILED if the request failed.
+    """
+    nextjs_api_url = f"{APP_HOST}/api/stock/quote/{symbol}"
+    try:
+        print(f"Fetching real-time price from Next.js API: {nextjs_api_url}")
+        quote_data = http_get(session, limiter, metrics, nextjs_api_url, symbol, 'quote', cache)
+        realtime_price = quote_data.get('price')
+        if realtime_price is None:
+            print(f"No real-time price found in Next.js API response for {symbol}.")
+        return realtime_price
+    except requests.exceptions.HTTPError as e:
+        # The quote route answers 404 when Yahoo has no price for the symbol
+        if e.response is not None and e.response.status_code == 404:
+            print(f"No real-time price found by Next.js API for {symbol}.")
+            return None
+        print(f"Error fetching real-time price from Next.js API for {symbol}: {e}")
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching real-time price from Next.js API for {symbol}: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred while processing real-time price for {symbol}: {e}")
+    return QUOTE_FAILED
+
+def fetch_quote_prices(session, limiter, metrics, symbols, cache=None):
+    """
+    Fetches the real-time prices of up to MAX_QUOTE_BATCH_SIZE symbols in one request
+    to the local API's batch quote route. Returns a dict mapping every symbol to its
+    price, or to None if the API has none, or None if the request failed.
+    """
+    nextjs_api_url = f"{APP_HOST}/api/stock/quote?{urlencode({'symbols': ','.join(symbols)}, safe=',')}"
+    try:
+        print(f"Fetching real-time prices for {len(symbols)} symbols from Next.js API")
+        quote_data = http_get(session, limiter, metrics, nextjs_api_url, purpose='quote_batch', cache=cache)
+        prices = dict.fromkeys(symbols)
+        for item in quote_data.get('quotes', []):
+            if item.get('symbol') in prices:
+                prices[item['symbol']] = item.get('price')
+        return prices
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching real-time prices for {len(symbols)} symbols from Next.js API: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred while processing batch real-time prices: {e}")
+    return None
+
+class QuoteBatcher:
+    """
+    Prefetches quote prices in multi-symbol requests of `batch_size` symbols, with up
+    to `workers` requests in flight.
+
+    `prices` maps every symbol of a successful batch to its price, or to None if the
+    API has none. Symbols of failed batches are left out, so fetch_stock_data falls
+    back to a per-symbol request for them.
+    """
+
+    def __init__(self, session, limiter, metrics, batch_size, workers, cache=None):
+        self.session = session
+        self.limiter = limiter
+        self.metrics = metrics
+        self.batch_size = min(max(1, batch_size), MAX_QUOTE_BATCH_SIZE)
+        self.workers = max(1, workers)
+        self.cache = cache
+        self.prices = {}
+
+    def prefetch(self, stocks, on_batch=None):
+        """
+        Fetches the prices of the stocks not answered by an earlier batch. on_batch(prices),
+        if given, is called on this thread with each batch as it completes.
+        """
+        symbols = list(dict.fromkeys(stock['symbol'] for stock in stocks if stock['symbol'] not in self.prices))
+        if not symbols:
+            return
+        batches = list(iter_chunks(symbols, self.batch_size))
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as executor:
+            futures = [executor.submit(self._fetch, batch) for batch in batches]
+            for future in as_completed(futures):
+                prices = future.result()
+                if prices is None:
+                    continue
+                self.prices.update(prices)
+                if on_batch is not None:
+                    on_batch(prices)
+        priced = sum(self.prices.get(symbol) is not None for symbol in symbols)
+        print(f"Prefetched {priced} of {len(symbols)} quote prices in {len(batches)} batch requests.")
+
+    def _fetch(self, symbols):
+        with self.metrics.stage('quote_batch', rows=len(symbols)):
+            return fetch_quote_prices(self.session, self.limiter, self.metrics, symbols, self.cache)
+
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+_JSON_ARRAY_START = re.compile(r'\s*:\s*(\S)')
+_JSON_KEY_PENDING = re.compile(r'\s*(:\s*)?\Z')
+
+def iter_json_array(byte_chunks, key):
+    """
+    Incrementally decodes the objects of the array stored under `key` in a JSON
+    document arriving as a stream of byte chunks, without holding the whole body.
+    Raises ValueError if the key is missing, is not an array, or the JSON is malformed.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(byte_chunks)
+    buffer = ''
+    pos = 0
+    exhausted = False
+
+    def read_more():
+        # Drops consumed text and appends the next chunk; False once the stream is over
+        nonlocal buffer, pos, exhausted
+        buffer = buffer[pos:]
+        pos = 0
+        for data in chunks:
+            if data:
+                buffer += utf8.decode(data)
+                return True
+        if not exhausted:
+            buffer += utf8.decode(b'', final=True)
+            exhausted = True
+        return False
+
+    marker = f'"{key}"'
+    while True:
+        found = buffer.find(marker, pos)
+        if found == -1:
+            # Keep a tail in case the key is split across chunks
+            pos = max(pos, len(buffer) - len(marker))
+        else:
+            match = _JSON_ARRAY_START.match(buffer, found + len(marker))
+            if match:
+                if match.group(1) != '[':
+                    raise ValueError(f"'{key}' is not an array")
+                pos = match.end()
+                break
+            if not _JSON_KEY_PENDING.match(buffer, found + len(marker)):
+                # The marker is a string value, not the key; search on after it
+                pos = found + len(marker)
+                continue
+            # The buffer ends right after the marker, so it may still be the key
+            pos = found
+        if not read_more():
+            raise ValueError(f"'{key}' not found in response")
+
+    while True:
+        pos = _JSON_SEPARATORS.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if not read_more():
+                raise ValueError(f"Unterminated '{key}' array")
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the item is split across chunks
+            if not read_more():
+                raise
+            continue
+        yield item
+
+def fetch_historical_data(session, limiter, metrics, symbol, start_date=None, stream=True, cache=None):
+    """
+    Fetches historical stock data for a given stock symbol from the local API.
+    If start_date is given, only bars on or after that date are requested.
+
+    By default the request only waits for the response headers and returns an
+    iterator that parses the 'historicalData' records as the body is read; it raises
+    requests or ValueError exceptions while iterating. With stream=False the full
+    list of records is returned. Returns None if the request fails.
+
+    With a ResponseCache, a fresh cached body is used instead of the API, and fully
+    read responses are stored in it.
+    """
     # Use the APP_HOST global variable
     api_url = f"{APP_HOST}/api/stock/{symbol}/historical/max"
-    
+    if start_date is not None:
+        api_url += f"?start={start_date.isoformat()}"
+
+    cached_path = cache.get(api_url) if cache is not None else None
+    if cached_path is not None:
+        metrics.count('cache_hits')
+        print(f"Using cached historical data for {symbol} from {api_url}")
+        if stream:
+            return iter_json_array(cache.iter_chunks(cached_path, HISTORY_STREAM_CHUNK_BYTES), 'historicalData')
+        try:
+            with open(cached_path, 'rb') as f:
+                json_response = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached historical stock data for {symbol}: {e}")
+            return None
+        return json_response.get('historicalData') if isinstance(json_response, dict) else None
+
+    print(f"Fetching historical data for {symbol} from {api_url}")
     try:
-        print(f"Fetching historical data for {symbol} from {api_url}")
-        response = requests.get(api_url, headers=HEADERS)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        json_response = response.json()
-        if isinstance(json_response, dict) and 'historicalData' in json_response:
-            return json_response['historicalData']
-        print(f"Unexpected API response format for {symbol}: {json_response}")
+        limiter.acquire(api_url)
+    except ApiBudgetExhausted as e:
+        print(f"Error fetching historical stock data for {symbol}: {e}")
         return None
+    started = time.perf_counter()
+    try:
+        response = session.get(api_url, stream=stream)
     except requests.exceptions.RequestException as e:
+        metrics.api_call('history', api_url, symbol, seconds=time.perf_counter() - started, error=str(e))
         print(f"Error fetching historical stock data for {symbol}: {e}")
         return None
 
-def update_stock_price(connection, stock_id, price):
-    """Updates the price of a stock in the stocks table."""
-    cursor = connection.cursor()
+    # Streamed bodies are counted in the 'bytes' counter as they are read
+    metrics.api_call(
+        'history', api_url, symbol, response.status_code, time.perf_counter() - started,
+        None if stream else len(response.content)
+    )
     try:
-        cursor.execute("UPDATE stocks SET price = %s WHERE id = %s", (str(price), stock_id))
-        connection.commit()
-        print(f"Successfully updated price for stock_id {stock_id} to {price}.")
-    except Error as e:
-        print(f"Error updating stock price for stock_id {stock_id}: {e}")
-        connection.rollback()
-    finally:
-        cursor.close()
+        response.raise_for_status()  # Raise an exception for HTTP errors
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching historical stock data for {symbol}: {e}")
+        response.close()
+        return None
 
+    if stream:
+        def records():
+            with response:
+                chunks = metrics.count_bytes(response.iter_content(HISTORY_STREAM_CHUNK_BYTES))
+                if cache is not None:
+                    chunks = cache.tee(api_url, chunks)
+                yield from iter_json_array(chunks, 'historicalData')
+                # Read the rest of the body so the cached copy is complete
+                for _ in chunks:
+                    pass
+        return records()
 
-def upsert_daily_prices(connection, stock_id, daily_data):
-    """
-    Upserts a list of daily price records into the stocksdailyprice table.
-    It will insert a new record or update an existing one if the stock_id and date match.
+    try:
+        json_response = response.json()
+    except ValueError as e:
+        print(f"Error decoding historical stock data for {symbol}: {e}")
+        return None
+    if isinstance(json_response, dict) and 'historicalData' in json_response:
+        if cache is not None:
+            cache.put(api_url, response.content)
+        return json_response['historicalData']
+    print(f"Unexpected API response format for {symbol}: {json_response}")
+    return None
+
+DAILY_PRICE_COLUMNS = (
+    'stock_id', 'date', 'open', 'high', 'low', 'close', 'volume',
+    'adj_open', 'adj_high', 'adj_low', 'adj_close', 'adj_volume', 'daily_change'
+)
+DAILY_PRICE_COLUMN_LIST = ", ".join(f"`{column}`" for column in DAILY_PRICE_COLUMNS)
+DAILY_PRICE_UPDATE_COLUMNS = DAILY_PRICE_COLUMNS[2:]
+
+class UnorderedHistoryError(ValueError):
+    """Raised when streamed price records are not in ascending date order."""
+
+def record_date(record):
+    """Returns the YYYY-MM-DD date of an API price record, or None if it has none."""
+    # The API might return 'timestamp', 'date', or 'datetime'. We need to handle all.
+    date_str = record.get('timestamp') or record.get('date') or record.get('datetime')
+    if not date_str:
+        return None
+    # The date might have a 'T' or a space and time part, so we split it.
+    return date_str.split('T')[0].split(' ')[0]
+
+def iter_daily_price_rows(stock_id, dated_records, last_date=None, last_close=None):
     """
-    cursor = connection.cursor()
-    upsert_query = """
-        INSERT INTO stocksdailyprice (
-            stock_id, `date`, `open`, `high`, `low`, `close`, `volume`,
-            `adj_open`, `adj_high`, `adj_low`, `adj_close`, `adj_volume`, `daily_change`
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            `open` = VALUES(`open`),
-            `high` = VALUES(`high`),
-            `low` = VALUES(`low`),
-            `close` = VALUES(`close`),
-            `volume` = VALUES(`volume`),
-            `adj_open` = VALUES(`adj_open`),
-            `adj_high` = VALUES(`adj_high`),
-            `adj_low` = VALUES(`adj_low`),
-            `adj_close` = VALUES(`adj_close`),
-            `adj_volume` = VALUES(`adj_volume`),
-            `daily_change` = VALUES(`daily_change`)
+    Converts (date, record) pairs in ascending date order into stocksdailyprice row tuples.
+    When last_date is given, records on or before it are skipped, and last_close seeds
+    the daily_change of the first new record. Raises UnorderedHistoryError if a record
+    is older than the one before it.
     """
-    
-    # Sort data by date to ensure correct daily_change calculation
-    daily_data.sort(key=lambda x: x.get('date') or x.get('datetime') or x.get('timestamp'))
+    last_date_str = last_date.isoformat() if last_date is not None else None
+    prev_close = float(last_close) if last_close is not None else None
+    prev_date = None
 
-    records_to_insert = []
-    for i, record in enumerate(daily_data):
-        # The API might return 'timestamp', 'date', or 'datetime'. We need to handle all.
-        date_str = record.get('timestamp') or record.get('date') or record.get('datetime')
-        if not date_str:
+    for formatted_date, record in dated_records:
+        if formatted_date is None:
+            continue
+        if prev_date is not None and formatted_date < prev_date:
+            raise UnorderedHistoryError(f"{formatted_date} follows {prev_date}")
+        prev_date = formatted_date
+        if last_date_str is not None and formatted_date <= last_date_str:
             continue
-
-        # The date might have a 'T' or a space and time part, so we split it.
-        formatted_date = date_str.split('T')[0].split(' ')[0]
 
         current_close = record.get('close')
         daily_change = 0.0
 
-        if i > 0:
-            prev_close = daily_data[i-1].get('close')
-            if current_close is not None and prev_close is not None:
-                daily_change = current_close - prev_close
+        if current_close is not None and prev_close is not None:
+            daily_change = current_close - prev_close
+        prev_close = current_close
 
-        records_to_insert.append((
+        yield (
             stock_id,
             formatted_date,
             record.get('open'),
@@ -172,21 +603,298 @@ def upsert_daily_prices(connection, stock_id, daily_data):
             record.get('adjClose') or record.get('close'),# Fallback to close if adjClose is not present
             record.get('adjVolume') or record.get('volume'), # Fallback to volume if adjVolume is not present
             daily_change
-        ))
+        )
 
-    if not records_to_insert:
-        print("No valid records to insert.")
-        return
+def stream_daily_price_rows(stock_id, records, last_date=None, last_close=None):
+    """Lazily converts API price records that are already in date order into row tuples."""
+    return iter_daily_price_rows(stock_id, ((record_date(record), record) for record in records), last_date, last_close)
 
-    try:
-        cursor.executemany(upsert_query, records_to_insert)
-        connection.commit()
-        print(f"Successfully upserted {cursor.rowcount} records for stock_id {stock_id}.")
-    except Error as e:
-        print(f"Error during upsert for stock_id {stock_id}: {e}")
-        connection.rollback()
-    finally:
-        cursor.close()
+def build_daily_price_rows(stock_id, daily_data, last_date=None, last_close=None):
+    """Converts API price records in any order into a list of row tuples, ordered by date."""
+    dated_records = [(record_date(record), record) for record in daily_data]
+    dated_records = [pair for pair in dated_records if pair[0] is not None]
+    dated_records.sort(key=lambda pair: pair[0])
+    return list(iter_daily_price_rows(stock_id, dated_records, last_date, last_close))
+
+def iter_chunks(iterable, size):
+    """Yields lists of up to `size` items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+class BulkPriceWriter:
+    """
+    Buffers price writes across many stocks and flushes them in large batches.
+
+    Daily price rows are written with multi-row INSERT ... ON DUPLICATE KEY UPDATE
+    statements of at most `batch_size` rows, and buffered stock prices with a single
+    set-based UPDATE, all in one transaction per flush. A flush happens when the
+    buffer reaches `batch_size` rows or `flush_interval` seconds have passed.
+
+    With `use_load_data`, rows added with staged=True (backfills of new symbols) are
+    streamed to a tab-separated file instead, loaded into a temporary staging table
+    with LOAD DATA LOCAL INFILE and merged into stocksdailyprice in one statement once
+    `staging_batch_size` rows have accumulated.
+
+    Checkpoints added with add_checkpoint() are written to the run journal once all
+    rows buffered before them are committed. A failed flush or merge is retried in
+    halves by stock until the stocks whose own rows fail are isolated; only those are
+    collected in `failed_stock_ids` and never checkpointed.
+    """
+
+    STAGING_TABLE = 'stocksdailyprice_staging'
+
+    def __init__(self, connection, metrics, batch_size, flush_interval, use_load_data=False,
+                 staging_batch_size=200000, journal=None):
+        self.connection = connection
+        self.metrics = metrics
+        self.journal = journal
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.use_load_data = use_load_data
+        self.staging_batch_size = max(1, staging_batch_size)
+        self.price_rows = []
+        self.stock_prices = {}
+        self.last_flush = time.monotonic()
+        self.staging_file = None
+        self.staged_row_count = 0
+        self.staged_stock_ids = set()
+        self.staging_table_ready = False
+        self.pending_checkpoints = []  # [stock_id, stage, awaiting_flush, awaiting_staged_merge]
+        self.failed_stock_ids = set()
+
+    def add_stock_price(self, stock_id, price):
+        """Buffers the latest price for a stock."""
+        self.stock_prices[stock_id] = price
+        self._maybe_flush()
+
+    def add_daily_prices(self, rows, staged=False):
+        """Buffers stocksdailyprice rows; staged rows go through LOAD DATA when enabled."""
+        if staged and self.use_load_data:
+            self._stage_rows(rows)
+        else:
+            self.price_rows.extend(rows)
+        self._maybe_flush()
+
+    def add_checkpoint(self, stock_id, stage):
+        """Journals a completed stage once everything buffered so far is committed."""
+        self.pending_checkpoints.append(
+            [stock_id, stage, bool(self.price_rows or self.stock_prices), self.staging_file is not None]
+        )
+        self._commit_checkpoints()
+
+    def _commit_checkpoints(self):
+        ready = []
+        pending = []
+        for checkpoint in self.pending_checkpoints:
+            if checkpoint[0] in self.failed_stock_ids:
+                continue
+            if checkpoint[2] or checkpoint[3]:
+                pending.append(checkpoint)
+            else:
+                ready.append((checkpoint[0], checkpoint[1]))
+        self.pending_checkpoints = pending
+        if ready and self.journal is not None:
+            self.journal.mark(ready)
+
+    def _maybe_flush(self):
+        if len(self.price_rows) + len(self.stock_prices) >= self.batch_size:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        if self.staged_row_count >= self.staging_batch_size:
+            self.flush_staged()
+
+    def flush(self):
+        """Writes all buffered daily prices and stock prices in a single transaction."""
+        self.last_flush = time.monotonic()
+        if not self.price_rows and not self.stock_prices:
+            return
+
+        price_rows, self.price_rows = self.price_rows, []
+        stock_prices, self.stock_prices = self.stock_prices, {}
+
+        def write(cursor, stock_ids):
+            upserted = 0
+            rows = [row for row in price_rows if row[0] in stock_ids]
+            for start in range(0, len(rows), self.batch_size):
+                chunk = rows[start:start + self.batch_size]
+                cursor.execute(self._upsert_query(len(chunk)), [value for row in chunk for value in row])
+                upserted += cursor.rowcount
+            prices = {stock_id: price for stock_id, price in stock_prices.items() if stock_id in stock_ids}
+            if prices:
+                cursor.execute(*self._stock_price_query(prices))
+            return upserted
+
+        stock_ids = {row[0] for row in price_rows} | set(stock_prices)
+        cursor = self.connection.cursor()
+        try:
+            with self.metrics.stage('price_upsert', rows=len(price_rows), stock_prices=len(stock_prices)):
+                upserted = write(cursor, stock_ids)
+                self.connection.commit()
+            self.metrics.count('price_rows_written', len(price_rows))
+            self.metrics.count('stock_prices_written', len(stock_prices))
+            print(f"Flushed {len(price_rows)} daily price rows ({upserted} affected) "
+                  f"and {len(stock_prices)} stock prices.")
+        except Error as e:
+            print(f"Error flushing {len(price_rows)} daily price rows and {len(stock_prices)} stock prices: {e}")
+            self.connection.rollback()
+            failed = self._isolate_failed_stocks(stock_ids, write)
+            self.metrics.count('price_rows_written', sum(row[0] not in failed for row in price_rows))
+            self.metrics.count('stock_prices_written', sum(stock_id not in failed for stock_id in stock_prices))
+        finally:
+            cursor.close()
+
+        for checkpoint in self.pending_checkpoints:
+            checkpoint[2] = False
+        self._commit_checkpoints()
+
+    def _isolate_failed_stocks(self, stock_ids, write):
+        """
+        After a batch write failed, retries it in halves by stock, each half in its own
+        transaction, until every failing stock is alone. Only those stocks are added to
+        `failed_stock_ids`, so one bad row does not fail the rest of the batch.
+        write(cursor, stock_ids) issues the statements for a subset. Returns the failed ids.
+        """
+        failed = set()
+        pending = [(sorted(stock_ids), True)]  # (stock ids, known to fail)
+        while pending:
+            ids, known_to_fail = pending.pop()
+            if not known_to_fail and self._write_subset(write, ids):
+                continue
+            if len(ids) == 1:
+                failed.update(ids)
+            else:
+                middle = len(ids) // 2
+                pending += [(ids[middle:], False), (ids[:middle], False)]
+        if len(failed) < len(stock_ids):
+            print(f"Wrote {len(stock_ids) - len(failed)} stocks of the failed batch separately; "
+                  f"{len(failed)} stocks failed: {', '.join(str(stock_id) for stock_id in sorted(failed))}")
+        self.failed_stock_ids.update(failed)
+        return failed
+
+    def _write_subset(self, write, stock_ids):
+        """Runs write(cursor, stock_ids) in its own transaction; False if it was rolled back."""
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            write(cursor, set(stock_ids))
+            self.connection.commit()
+            return True
+        except Error:
+            self.connection.rollback()
+            return False
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def _upsert_query(self, row_count):
+        placeholders = "(" + ", ".join(["%s"] * len(DAILY_PRICE_COLUMNS)) + ")"
+        updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in DAILY_PRICE_UPDATE_COLUMNS)
+        return (
+            f"INSERT INTO stocksdailyprice ({DAILY_PRICE_COLUMN_LIST}) "
+            f"VALUES {', '.join([placeholders] * row_count)} "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def _stock_price_query(self, stock_prices):
+        cases = " ".join(["WHEN %s THEN %s"] * len(stock_prices))
+        id_placeholders = ", ".join(["%s"] * len(stock_prices))
+        params = [value for stock_id, price in stock_prices.items() for value in (stock_id, str(price))]
+        params.extend(stock_prices.keys())
+        query = f"UPDATE stocks SET price = CASE id {cases} END WHERE id IN ({id_placeholders})"
+        return query, params
+
+    def _stage_rows(self, rows):
+        if self.staging_file is None:
+            self.staging_file = tempfile.NamedTemporaryFile(
+                mode='w', suffix='.tsv', prefix='stocksdailyprice_', delete=False, newline=''
+            )
+        for row in rows:
+            self.staging_file.write("\t".join(r"\N" if value is None else str(value) for value in row))
+            self.staging_file.write("\n")
+        self.staged_row_count += len(rows)
+        self.staged_stock_ids.update(row[0] for row in rows)
+
+    def flush_staged(self):
+        """Loads the staged rows into the staging table and merges them into stocksdailyprice."""
+        if self.staging_file is None:
+            return
+
+        staging_file, self.staging_file = self.staging_file, None
+        staged_row_count, self.staged_row_count = self.staged_row_count, 0
+        staged_stock_ids, self.staged_stock_ids = self.staged_stock_ids, set()
+        staging_file.close()
+
+        cursor = self.connection.cursor()
+        try:
+            with self.metrics.stage('staged_merge', rows=staged_row_count):
+                if not self.staging_table_ready:
+                    cursor.execute(f"""
+                        CREATE TEMPORARY TABLE IF NOT EXISTS {self.STAGING_TABLE} (
+                            stock_id int NOT NULL,
+                            `date` date NOT NULL,
+                            `open` decimal(10,2), `high` decimal(10,2), `low` decimal(10,2), `close` decimal(10,2),
+                            `volume` int,
+                            `adj_open` decimal(10,2), `adj_high` decimal(10,2), `adj_low` decimal(10,2),
+                            `adj_close` decimal(10,2), `adj_volume` int, `daily_change` decimal(10,2)
+                        )
+                    """)
+                    self.staging_table_ready = True
+
+                self._load_staging_table(cursor, staging_file.name)
+                self._merge_staged(cursor, staged_stock_ids)
+                self.connection.commit()
+            self.metrics.count('price_rows_written', staged_row_count)
+            print(f"Merged {staged_row_count} staged daily price rows via LOAD DATA.")
+        except Error as e:
+            print(f"Error merging {staged_row_count} staged daily price rows: {e}")
+            self.connection.rollback()
+            # The load is rolled back with the merge; reload it once, then merge subsets of the stocks
+            try:
+                self._load_staging_table(cursor, staging_file.name)
+                self.connection.commit()
+            except Error as e:
+                print(f"Error reloading {staged_row_count} staged daily price rows: {e}")
+                self.connection.rollback()
+                self.failed_stock_ids.update(staged_stock_ids)
+            else:
+                self._isolate_failed_stocks(staged_stock_ids, self._merge_staged)
+        finally:
+            cursor.close()
+            os.remove(staging_file.name)
+
+        for checkpoint in self.pending_checkpoints:
+            checkpoint[3] = False
+        self._commit_checkpoints()
+
+    def _load_staging_table(self, cursor, path):
+        cursor.execute(f"TRUNCATE TABLE {self.STAGING_TABLE}")
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {self.STAGING_TABLE} "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({DAILY_PRICE_COLUMN_LIST})",
+            (path,)
+        )
+
+    def _merge_staged(self, cursor, stock_ids):
+        """Merges the staged rows of `stock_ids` into stocksdailyprice."""
+        stock_ids = list(stock_ids)
+        updates = ", ".join(f"`{column}` = staged.`{column}`" for column in DAILY_PRICE_UPDATE_COLUMNS)
+        cursor.execute(
+            f"INSERT INTO stocksdailyprice ({DAILY_PRICE_COLUMN_LIST}) "
+            f"SELECT {DAILY_PRICE_COLUMN_LIST} FROM {self.STAGING_TABLE} AS staged "
+            f"WHERE staged.stock_id IN ({', '.join(['%s'] * len(stock_ids))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}",
+            stock_ids
+        )
+
+    def close(self):
+        """Flushes everything still buffered."""
+        self.flush()
+        self.flush_staged()
 
 def mock_fetch_news(stock_symbol, company_name):
     """Mocks fetching news for a given stock symbol and company name."""
@@ -212,13 +920,45 @@ def mock_fetch_news(stock_symbol, company_name):
         })
     return mock_articles
 
-def calculate_sentiment(text):
-    """Calculates sentiment score using TextBlob."""
-    analysis = TextBlob(text)
-    return analysis.sentiment.polarity # Polarity ranges from -1.0 (negative) to 1.0 (positive)
+def index_user_stocks(user_stocks):
+    """Groups user_stocks entries into a dict mapping stock_id to the list of user_ids holding it."""
+    users_by_stock = {}
+    for us in user_stocks:
+        users_by_stock.setdefault(us['stock_id'], []).append(us['user_id'])
+    return users_by_stock
+
+def lookup_news_ids(cursor, links, scored_only=False):
+    """
+    Resolves news ids for a collection of links with one IN query per chunk.
+    With scored_only, only articles that already have a sentiment_score are returned.
+    """
+    links = list(links)
+    news_ids = {}
+    condition = " AND sentiment_score IS NOT NULL" if scored_only else ""
+    for start in range(0, len(links), NEWS_LOOKUP_CHUNK_SIZE):
+        chunk = links[start:start + NEWS_LOOKUP_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT id, link FROM news WHERE link IN ({placeholders}){condition}", chunk)
+        for news_id, link in cursor.fetchall():
+            news_ids[link] = news_id
+    return news_ids
+
+def fetch_scored_news_ids(connection, links):
+    """Returns a dict mapping link to news id for articles that are already scored."""
+    cursor = connection.cursor()
+    try:
+        return lookup_news_ids(cursor, links, scored_only=True)
+    except Error as e:
+        print(f"Error looking up scored news: {e}")
+        return {}
+    finally:
+        cursor.close()
 
 def upsert_news(connection, news_items):
-    """Upserts news items into the 'news' table."""
+    """
+    Upserts news items into the 'news' table.
+    Returns a dict mapping each article link to its news id.
+    """
     cursor = connection.cursor()
     upsert_query = """
         INSERT INTO news (title, link, pub_date, source, sentiment_score, created_at)
@@ -230,6 +970,7 @@ def upsert_news(connection, news_items):
             sentiment_score = VALUES(sentiment_score),
             created_at = VALUES(created_at)
     """
+    now = datetime.now()
     records_to_insert = []
     for item in news_items:
         records_to_insert.append((
@@ -238,123 +979,730 @@ def upsert_news(connection, news_items):
             item['pub_date'],
             item['source'],
             item['sentiment_score'],
-            datetime.now()
+            now
         ))
     
     if not records_to_insert:
         print("No news records to insert.")
-        return []
+        return {}
 
     try:
         cursor.executemany(upsert_query, records_to_insert)
         connection.commit()
         print(f"Successfully upserted {cursor.rowcount} news records.")
-        
-        # Fetch IDs for newly inserted/updated news items (assuming link is unique)
-        inserted_news_ids = []
-        for item in news_items:
-            cursor.execute("SELECT id FROM news WHERE link = %s", (item['link'],))
-            result = cursor.fetchone()
-            if result:
-                inserted_news_ids.append(result[0])
-        return inserted_news_ids
+
+        # Resolve the ids of all upserted items in bulk (link is unique)
+        return lookup_news_ids(cursor, {item['link'] for item in news_items})
     except Error as e:
         print(f"Error during news upsert: {e}")
         connection.rollback()
-        return []
+        return {}
     finally:
         cursor.close()
 
-def link_news_to_user_stocks(connection, user_id, stock_id, news_ids):
-    """Links news items to a specific user_stock entry in 'user_stock_news' table."""
-    cursor = connection.cursor()
-    insert_query = """
-        INSERT IGNORE INTO user_stock_news (user_id, stock_id, news_id)
-        VALUES (%s, %s, %s)
+def link_news_to_user_stocks(connection, links):
     """
-    records_to_insert = []
-    for news_id in news_ids:
-        records_to_insert.append((user_id, stock_id, news_id))
-    
-    if not records_to_insert:
-        return
+    Links news items to user_stock entries in the 'user_stock_news' table.
+    `links` is a list of (user_id, stock_id, news_id) tuples, written in one transaction.
+    Returns True if the links were committed.
+    """
+    if not links:
+        return True
 
+    cursor = connection.cursor()
     try:
-        cursor.executemany(insert_query, records_to_insert)
+        linked = 0
+        for start in range(0, len(links), NEWS_LINK_CHUNK_SIZE):
+            chunk = links[start:start + NEWS_LINK_CHUNK_SIZE]
+            placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+            cursor.execute(
+                f"INSERT IGNORE INTO user_stock_news (user_id, stock_id, news_id) VALUES {placeholders}",
+                [value for link in chunk for value in link]
+            )
+            linked += cursor.rowcount
         connection.commit()
-        print(f"Successfully linked {cursor.rowcount} news items to user_stock ({user_id}, {stock_id}).")
+        print(f"Successfully linked {linked} new news items across {len(links)} user_stock links.")
+        return True
     except Error as e:
-        print(f"Error linking news to user_stock ({user_id}, {stock_id}): {e}")
+        print(f"Error linking {len(links)} news items to user_stocks: {e}")
         connection.rollback()
+        return False
     finally:
         cursor.close()
 
+class NewsWriter:
+    """
+    Batches the news stage across stocks.
+
+    Articles for up to `batch_size` stocks are handled together: links already stored
+    with a sentiment score are resolved in one lookup and skipped, the rest are scored
+    by the sentiment engine and upserted, and their ids resolved in bulk. The resulting
+    user_stock_news links are held until close() and written in one INSERT IGNORE
+    transaction; a sharded worker closes after every claimed batch.
+
+    The 'news' and 'links' stages are checkpointed in the run journal as they are
+    committed; stocks whose news upsert failed are collected in `failed_stock_ids`.
+    """
+
+    def __init__(self, connection, metrics, user_stocks, batch_size, sentiment_engine, journal=None):
+        self.connection = connection
+        self.metrics = metrics
+        self.sentiment_engine = sentiment_engine
+        self.journal = journal
+        self.users_by_stock = index_user_stocks(user_stocks)
+        self.batch_size = max(1, batch_size)
+        self.pending = []  # (stock_id, news_items)
+        self.links = []
+        self.linked_stock_ids = set()
+        self.failed_stock_ids = set()
+
+    def add(self, stock_id, news_items):
+        """Queues the articles fetched for a stock."""
+        self.pending.append((stock_id, news_items))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Scores and upserts the queued articles and records their user_stock links."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+
+        news_items = [item for _, items in pending for item in items]
+        news_ids = fetch_scored_news_ids(self.connection, {item['link'] for item in news_items})
+
+        new_items = list({item['link']: item for item in news_items if item['link'] not in news_ids}.values())
+        with self.metrics.stage('sentiment', texts=len(new_items)):
+            scores = self.sentiment_engine.score([item['title'] for item in new_items])
+        for item, score in zip(new_items, scores):
+            item['sentiment_score'] = score
+
+        if new_items:
+            with self.metrics.stage('news_upsert', rows=len(new_items)):
+                upserted_ids = upsert_news(self.connection, new_items)
+            if not upserted_ids:
+                self.failed_stock_ids.update(stock_id for stock_id, _ in pending)
+                return
+            news_ids.update(upserted_ids)
+            self.metrics.count('news_rows_written', len(new_items))
+        else:
+            print(f"All {len(news_items)} news items are already scored.")
+        if self.journal is not None:
+            self.journal.mark((stock_id, 'news') for stock_id, _ in pending)
+        # Stocks with nothing to link still get their 'links' checkpoint on close()
+        self.linked_stock_ids.update(stock_id for stock_id, _ in pending)
+        if not news_ids:
+            print(f"No news IDs returned for {len(pending)} stocks, skipping linking.")
+            return
+
+        for stock_id, items in pending:
+            for user_id in self.users_by_stock.get(stock_id, ()):
+                for item in items:
+                    news_id = news_ids.get(item['link'])
+                    if news_id is not None:
+                        self.links.append((user_id, stock_id, news_id))
+
+    def close(self):
+        """Flushes queued articles and writes every collected link."""
+        self.flush()
+        links, self.links = self.links, []
+        linked_stock_ids, self.linked_stock_ids = self.linked_stock_ids, set()
+        with self.metrics.stage('linking', rows=len(links)):
+            committed = link_news_to_user_stocks(self.connection, links)
+        if committed:
+            self.metrics.count('news_links_written', len(links))
+            if self.journal is not None:
+                self.journal.mark((stock_id, 'links') for stock_id in linked_stock_ids)
+
+def fetch_stock_data(session, limiter, metrics, stock, watermark, today, cache=None, quote_prices=None):
+    """
+    Fetch stage for a single stock, run on a worker thread.
+    Returns the quote price and any new historical bars; never touches the database.
+    A price prefetched in `quote_prices` (QuoteBatcher.prices) is used without a request.
+    'price' is None both when the API has no price and when the request failed; the
+    latter also sets 'price_failed'.
+    """
+    symbol = stock['symbol']
+    last_date, last_close = watermark
+
+    if quote_prices is not None and symbol in quote_prices:
+        realtime_price = quote_prices[symbol]
+        if realtime_price is None:
+            print(f"No real-time price found in the batch quote for {symbol}.")
+    else:
+        with metrics.stage('quote', symbol):
+            realtime_price = fetch_quote_price(session, limiter, metrics, symbol, cache)
+    price_failed = realtime_price is QUOTE_FAILED
+    if price_failed:
+        realtime_price = None
+
+    history_up_to_date = last_date is not None and last_date >= today
+    if history_up_to_date:
+        print(f"Historical prices for {symbol} are up to date (last stored {last_date}).")
+        historical_data = None
+        refetch_history = None
+    else:
+        start_date = last_date + timedelta(days=1) if last_date is not None else None
+        # The worker waits for the response headers; the body is streamed by the writer
+        with metrics.stage('history_fetch', symbol):
+            historical_data = fetch_historical_data(
+                session, limiter, metrics, symbol, start_date=start_date, cache=cache
+            )
+        refetch_history = partial(
+            fetch_historical_data, session, limiter, metrics, symbol, start_date=start_date, stream=False, cache=cache
+        )
+
+    return {
+        'stock': stock,
+        'price': realtime_price,
+        'price_failed': price_failed,
+        'historical_data': historical_data,
+        'history_up_to_date': history_up_to_date,
+        'refetch_history': refetch_history,
+        'last_date': last_date,
+        'last_close': last_close,
+    }
+
+def needs_fetch(journal, stock):
+    """True unless the stock's price and history are journaled in this run."""
+    return not {'price', 'history'} <= journal.completed.get(stock['id'], set())
+
+def fetch_unjournaled_stock_data(session, limiter, metrics, journal, watermarks, today, cache, quote_prices, stock):
+    """
+    fetch_stock_data for stocks whose price and history are not journaled yet in
+    this run; the others are passed through with nothing fetched.
+    """
+    done_stages = set(journal.completed.get(stock['id'], ()))
+    if not needs_fetch(journal, stock):
+        return {'stock': stock, 'done_stages': done_stages}
+    result = fetch_stock_data(
+        session, limiter, metrics, stock, watermarks.get(stock['id'], (None, None)), today, cache, quote_prices
+    )
+    result['done_stages'] = done_stages
+    return result
+
+def iter_fetch_results(executor, fetch, stocks, max_pending):
+    """
+    Submits fetch(stock) for each stock and yields results as they complete.
+    At most max_pending fetches are in flight or awaiting the writer at once,
+    so fetched payloads never pile up faster than they are written.
+    """
+    stock_iter = iter(stocks)
+    pending = set()
+    while True:
+        for stock in stock_iter:
+            pending.add(executor.submit(fetch, stock))
+            if len(pending) >= max_pending:
+                break
+        if not pending:
+            return
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                yield future.result()
+            except Exception as e:
+                print(f"An unexpected error occurred in the fetch stage: {e}")
+
+def write_historical_data(price_writer, metrics, result):
+    """
+    Streams a stock's historical records into the price writer in fixed-size chunks.
+    If the records turn out not to be in date order, the history is fetched again
+    in full and sorted; rows already written are overwritten by the upsert.
+    Returns True if the whole history was queued.
+    """
+    stock_id = result['stock']['id']
+    symbol = result['stock']['symbol']
+    last_date, last_close = result['last_date'], result['last_close']
+    # Stocks without stored prices are full-history backfills
+    staged = last_date is None
+
+    written = 0
+    with metrics.stage('history_stream', symbol) as stage:
+        try:
+            rows = stream_daily_price_rows(stock_id, result['historical_data'], last_date, last_close)
+            for chunk in iter_chunks(rows, HISTORY_CHUNK_ROWS):
+                price_writer.add_daily_prices(chunk, staged=staged)
+                written += len(chunk)
+        except UnorderedHistoryError as e:
+            print(f"Historical data for {symbol} is not in date order ({e}), re-fetching to sort it.")
+            metrics.count('retries')
+            historical_data = result['refetch_history']()
+            if historical_data is None:
+                return False
+            rows = build_daily_price_rows(stock_id, historical_data, last_date, last_close)
+            for chunk in iter_chunks(rows, HISTORY_CHUNK_ROWS):
+                price_writer.add_daily_prices(chunk, staged=staged)
+            written = len(rows)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error reading historical stock data for {symbol} after {written} records: {e}")
+            metrics.count('history_errors')
+            return False
+        finally:
+            # Flushes triggered by this stock's rows are included in its stream time
+            stage['rows'] = written
+            metrics.count('price_rows_queued', written)
+
+    if written:
+        print(f"Queued {written} daily price records for {symbol}.")
+    else:
+        print(f"No new daily price records for {symbol}.")
+    return True
+
+def write_stock_data(price_writer, news_writer, metrics, result):
+    """
+    Writer stage for a single stock, always run on the main thread.
+    Stages in result['done_stages'] are skipped. Returns False if a stage failed.
+    """
+    stock = result['stock']
+    stock_id = stock['id']
+    symbol = stock['symbol']
+    company_name = stock.get('company_name', symbol) # Use symbol as fallback if company_name not present
+
+    done_stages = result['done_stages']
+    succeeded = True
+
+    print(f"\nProcessing data for {symbol} ({company_name})...")
+
+    if not {'price', 'history'} <= done_stages:
+        # --- Process Real-time Price from Next.js API ---
+        # A stock the API has no price for is done; only a failed request is retried
+        if result['price_failed']:
+            succeeded = False
+        else:
+            if result['price'] is not None:
+                price_writer.add_stock_price(stock_id, result['price'])
+            price_writer.add_checkpoint(stock_id, 'price')
+
+        # --- Process Historical Prices ---
+        if result['history_up_to_date']:
+            price_writer.add_checkpoint(stock_id, 'history')
+        elif result['historical_data'] is not None and write_historical_data(price_writer, metrics, result):
+            price_writer.add_checkpoint(stock_id, 'history')
+        else:
+            succeeded = False
+
+    # --- Process News ---
+    # Sentiment, upsert and linking run in batches across stocks in the news writer
+    if 'links' not in done_stages:
+        print(f"Processing news for {symbol} ({company_name})...")
+        news_writer.add(stock_id, mock_fetch_news(symbol, company_name))
+
+    print("-" * 30)
+    return succeeded
+
+def ingest_stocks(stocks, fetch, price_writer, news_writer, metrics, journal, workers, retries, retry_backoff,
+                  lease=None, budget=None, quotes=None):
+    """
+    Fetches and writes the stocks not completed in the journal yet. Fetches overlap
+    on a pool of `workers` threads; each finished stock is written on this thread,
+    one at a time. With a QuoteBatcher `quotes`, the quotes of each pass are
+    prefetched in batches first. Failed symbols are retried up to `retries` times
+    with exponential backoff, unless the ApiBudget `budget` is spent. A ShardLease
+    `lease` is renewed as stocks are written. Returns the stocks that still failed.
+    """
+    remaining = [stock for stock in stocks if not journal.is_complete(stock['id'])]
+    if len(remaining) < len(stocks):
+        print(f"Skipping {len(stocks) - len(remaining)} stocks already completed in run {journal.run_id}.")
+
+    for attempt in range(max(0, retries) + 1):
+        if not remaining:
+            break
+        if attempt:
+            if budget is not None and budget.exhausted:
+                print(f"Not retrying {len(remaining)} failed symbols, the API budget is spent.")
+                break
+            delay = retry_backoff * 2 ** (attempt - 1)
+            print(f"Retrying {len(remaining)} failed symbols in {delay:.0f}s (attempt {attempt} of {retries})...")
+            metrics.count('symbol_retries', len(remaining))
+            time.sleep(delay)
+            if lease:
+                lease.heartbeat()
+
+        if quotes is not None:
+            quotes.prefetch([stock for stock in remaining if needs_fetch(journal, stock)])
+
+        failed = set()
+        processed = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in iter_fetch_results(executor, fetch, remaining, workers * 2):
+                processed.add(result['stock']['id'])
+                if not write_stock_data(price_writer, news_writer, metrics, result):
+                    failed.add(result['stock']['id'])
+                metrics.count('stocks')
+                if lease:
+                    lease.heartbeat()
+
+        # Commit everything buffered so that failed writes are known before retrying
+        price_writer.close()
+        news_writer.flush()
+        failed |= {stock['id'] for stock in remaining} - processed
+        failed |= price_writer.failed_stock_ids | news_writer.failed_stock_ids
+        price_writer.failed_stock_ids.clear()
+        news_writer.failed_stock_ids.clear()
+
+        remaining = [stock for stock in remaining if stock['id'] in failed]
+    return remaining
+
+def ingest_leased_stocks(stocks, ingest, news_writer, journal, lease, claim_size):
+    """
+    Runs ingest(batch, lease=lease) over the batches a ShardLease `lease` claims until
+    nothing is left to claim. Each batch's links are written before its stocks are
+    completed; failed stocks and stocks unknown to this worker are released for any
+    worker to retry. Stops early only if the leases of a batch could not be updated.
+    Returns (handled stocks, stocks that failed their last attempt).
+    """
+    stocks_by_id = {stock['id']: stock for stock in stocks}
+    handled = {}
+    failed = {}
+    lease.seed(stocks)
+    while True:
+        claimed = lease.claim(claim_size)
+        if not claimed:
+            # Stocks of stalled workers are claimable once their leases expire
+            if lease.wait_for_leases():
+                continue
+            break
+        batch = [stocks_by_id[stock_id] for stock_id in claimed if stock_id in stocks_by_id]
+        ingest(batch, lease=lease)
+        # A stock is done only once its links are committed, so write them before completing it
+        news_writer.close()
+        done_ids = {stock['id'] for stock in batch if journal.is_complete(stock['id'])}
+        for stock in batch:
+            handled[stock['id']] = stock
+            if stock['id'] in done_ids:
+                failed.pop(stock['id'], None)
+            else:
+                failed[stock['id']] = stock
+        completed = lease.complete(done_ids)
+        # Stocks added after this worker started are left to a worker that knows them
+        released = lease.release([stock_id for stock_id in claimed if not completed or stock_id not in done_ids])
+        if not (completed and released):
+            print(f"Could not settle the leases of {len(claimed)} stocks, stopping this worker.")
+            break
+    return list(handled.values()), list(failed.values())
+
+def refresh_quote_prices(quotes, price_writer, stocks):
+    """
+    Refreshes only stocks.price: quotes are fetched in batches and each batch is
+    written as it arrives with one set-based UPDATE. Returns the stocks left unpriced.
+    """
+    stock_ids = {stock['symbol']: stock['id'] for stock in stocks}
+
+    def write(prices):
+        for symbol, price in prices.items():
+            if price is not None:
+                price_writer.add_stock_price(stock_ids[symbol], price)
+        price_writer.flush()
+
+    quotes.prefetch(stocks, on_batch=write)
+    return [
+        stock for stock in stocks
+        if quotes.prices.get(stock['symbol']) is None or stock['id'] in price_writer.failed_stock_ids
+    ]
+
+def add_pipeline_arguments(parser):
+    """Adds the fetch, writer, sentiment, cache and metrics options shared with ingest_scheduler.py."""
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of concurrent fetch workers (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--rate-limit',
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help="Maximum requests per second per upstream host, 0 to disable (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--burst',
+        type=int,
+        default=DEFAULT_BURST,
+        help="Requests allowed in a burst above the rate limit (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--quote-batch-size',
+        type=int,
+        default=DEFAULT_QUOTE_BATCH_SIZE,
+        help=f"Symbols per batch quote request, at most {MAX_QUOTE_BATCH_SIZE}; "
+             f"0 or 1 to request quotes one symbol at a time (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Daily price rows buffered per bulk upsert (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--flush-interval',
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help="Maximum seconds between bulk upsert flushes (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--news-batch-size',
+        type=int,
+        default=DEFAULT_NEWS_BATCH_SIZE,
+        help="Stocks whose news is upserted together (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--sentiment-cache',
+        default=DEFAULT_CACHE_PATH,
+        help="Path of the on-disk sentiment memo cache (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--sentiment-cache-size',
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Maximum entries kept in the sentiment cache (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--sentiment-workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes used to score uncached headlines (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--skip-features',
+        action='store_true',
+        help="Do not compute derived features into stocksdailyfeature after ingestion."
+    )
+    parser.add_argument(
+        '--skip-snapshot',
+        action='store_true',
+        help="Do not update the columnar price snapshot after ingestion."
+    )
+    parser.add_argument(
+        '--snapshot-dir',
+        default=DEFAULT_SNAPSHOT_DIR,
+        help="Directory of the columnar price snapshot (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the on-disk API response cache (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=DEFAULT_CACHE_TTL,
+        help="Seconds cached API responses stay valid, 0 to disable the cache (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="Times failed symbols are retried at the end of each pass (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        default=DEFAULT_RETRY_BACKOFF,
+        help="Seconds before the first retry, doubled for each further one (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--metrics-events',
+        default=DEFAULT_EVENTS_PATH,
+        help="JSON-lines file that stage timings and the API call audit are appended to, '' to disable (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--metrics-textfile-dir',
+        default=DEFAULT_TEXTFILE_DIR,
+        help="Directory to write a Prometheus textfile with each run's summary to (default: %(default)s)."
+    )
+
+def parse_args():
+    """Parses command line options."""
+    parser = argparse.ArgumentParser(description="Populate stocksdailyprice and news for all stocks.")
+    parser.add_argument(
+        '--full-backfill',
+        action='store_true',
+        help="Re-fetch and re-upsert the full price history for every stock instead of only new bars."
+    )
+    parser.add_argument(
+        '--quotes-only',
+        action='store_true',
+        help="Only refresh stocks.price for every stock from batch quotes, without history or news."
+    )
+    parser.add_argument(
+        '--load-data',
+        action='store_true',
+        help="Stream full-history backfills through a staging table with LOAD DATA LOCAL INFILE."
+    )
+    parser.add_argument(
+        '--staging-batch-size',
+        type=int,
+        default=DEFAULT_STAGING_BATCH_SIZE,
+        help="Staged rows per LOAD DATA merge when --load-data is set (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--resume',
+        nargs='?',
+        const='latest',
+        help="Continue an interrupted run: the latest unfinished one, or the given run id."
+    )
+    parser.add_argument(
+        '--journal',
+        default=DEFAULT_JOURNAL_PATH,
+        help="SQLite file of the run journal (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        help="Run as worker i of N sharded workers, e.g. 0/4 (default: process every stock)."
+    )
+    parser.add_argument(
+        '--cycle',
+        default=default_cycle(),
+        help="Name of the sharded run the workers coordinate on (default: today, %(default)s)."
+    )
+    parser.add_argument(
+        '--claim-size',
+        type=int,
+        default=DEFAULT_CLAIM_SIZE,
+        help="Stocks a sharded worker claims at a time (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--lease-seconds',
+        type=int,
+        default=DEFAULT_LEASE_SECONDS,
+        help="Seconds a claim lasts without renewal before other workers may steal it (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--no-steal',
+        action='store_true',
+        help="Only process the worker's own shard, never unclaimed or expired stocks of other shards."
+    )
+    parser.add_argument(
+        '--shard-status',
+        action='store_true',
+        help="Print the per-shard progress of --cycle and exit."
+    )
+    add_pipeline_arguments(parser)
+    args = parser.parse_args()
+    if args.shard and args.journal == DEFAULT_JOURNAL_PATH:
+        # Workers on one host must not resume each other's runs
+        args.journal = f"{DEFAULT_JOURNAL_PATH}.shard-{args.shard[0]}-of-{args.shard[1]}"
+    return args
+
 def main():
     """Main function to orchestrate the data population process."""
-    db_connection = create_db_connection()
+    args = parse_args()
+    metrics = RunMetrics('populate_daily_prices', args.metrics_events, args.metrics_textfile_dir)
+
+    db_connection = create_db_connection(allow_local_infile=args.load_data)
     if not db_connection:
+        metrics.close()
+        return
+    db_connection = CountingConnection(db_connection, metrics)
+
+    if args.shard_status:
+        print_shard_summary(db_connection, args.cycle)
+        db_connection.close()
+        metrics.close()
         return
 
     stocks = fetch_stocks(db_connection)
     if not stocks:
         db_connection.close()
+        metrics.close()
         return
-    
+
+    workers = max(1, args.workers)
+    session = create_http_session(workers)
+    limiter = RateLimiter(args.rate_limit, args.burst)
+
+    if args.quotes_only:
+        # Uncached, as the point is the current price
+        quotes = QuoteBatcher(session, limiter, metrics, args.quote_batch_size, workers)
+        price_writer = BulkPriceWriter(db_connection, metrics, args.batch_size, args.flush_interval)
+        unpriced = refresh_quote_prices(quotes, price_writer, stocks)
+        if unpriced:
+            print(f"{len(unpriced)} stocks were not repriced: {', '.join(stock['symbol'] for stock in unpriced)}")
+            metrics.count('symbols_failed', len(unpriced))
+        session.close()
+        db_connection.close()
+        metrics.close()
+        print("Script finished.")
+        return
+
     user_stocks = fetch_user_stocks(db_connection)
+    watermarks = {} if args.full_backfill else fetch_price_watermarks(db_connection)
+    today = date.today()
 
-    for stock in stocks:
-        stock_id = stock['id']
-        symbol = stock['symbol']
-        company_name = stock.get('company_name', symbol) # Use symbol as fallback if company_name not present
+    journal = RunJournal(args.journal)
+    run_id = journal.resume(None if args.resume == 'latest' else args.resume) if args.resume else None
+    if run_id is not None:
+        print(f"Resuming run {run_id}.")
+        metrics.event('resume', journal_run=run_id)
+    else:
+        if args.resume:
+            print("No unfinished run to resume, starting a new one.")
+        journal.start(metrics.run_id, vars(args))
+    cache = ResponseCache(args.cache_dir, args.cache_ttl)
+    quotes = QuoteBatcher(session, limiter, metrics, args.quote_batch_size, workers, cache) if args.quote_batch_size > 1 else None
 
-        print(f"\nProcessing data for {symbol} ({company_name})...")
+    price_writer = BulkPriceWriter(
+        db_connection, metrics, args.batch_size, args.flush_interval,
+        use_load_data=args.load_data, staging_batch_size=args.staging_batch_size, journal=journal
+    )
+    sentiment_engine = SentimentEngine(args.sentiment_cache, args.sentiment_cache_size, args.sentiment_workers)
+    news_writer = NewsWriter(db_connection, metrics, user_stocks, args.news_batch_size, sentiment_engine, journal)
 
-        # --- Process Real-time Price from Next.js API ---
-        try:
-            nextjs_api_url = f"{APP_HOST}/api/stock/quote/{symbol}"
-            print(f"Fetching real-time price from Next.js API: {nextjs_api_url}")
-            response = requests.get(nextjs_api_url, headers=HEADERS)
-            response.raise_for_status() # Raise an exception for HTTP errors
-            quote_data = response.json()
-            realtime_price = quote_data.get('price')
-
-            if realtime_price is not None:
-                update_stock_price(db_connection, stock_id, realtime_price)
-            else:
-                print(f"No real-time price found in Next.js API response for {symbol}.")
+    # Stocks whose price and history are already journaled are not fetched again
+    fetch = partial(
+        fetch_unjournaled_stock_data, session, limiter, metrics, journal, watermarks, today, cache,
+        quotes.prices if quotes else None
+    )
+    ingest = partial(
+        ingest_stocks, fetch=fetch, price_writer=price_writer, news_writer=news_writer, metrics=metrics,
+        journal=journal, workers=workers, retries=args.retries, retry_backoff=args.retry_backoff, quotes=quotes
+    )
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching real-time price from Next.js API for {symbol}: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred while processing real-time price for {symbol}: {e}")
+    lease = None
+    if args.shard:
+        lease = ShardLease(db_connection, args.cycle, *args.shard, args.lease_seconds, steal=not args.no_steal)
+        print(f"Worker {lease.owner} runs shard {args.shard[0]}/{args.shard[1]} of cycle {args.cycle}.")
 
-        # --- Process Historical Prices ---
-        historical_data = fetch_historical_data(symbol)
-        if historical_data is not None and len(historical_data) > 0:
-            upsert_daily_prices(db_connection, stock_id, historical_data)
-        
-        # --- Process News ---
-        print(f"Processing news for {symbol} ({company_name})...")
-        mock_news_items = mock_fetch_news(symbol, company_name)
-        
-        # Calculate sentiment for each mock news item
-        for item in mock_news_items:
-            item['sentiment_score'] = calculate_sentiment(item['title'])
-        
-        # Upsert news into the 'news' table and get their IDs
-        news_ids = upsert_news(db_connection, mock_news_items)
-
-        if news_ids:
-            # Link news to all relevant user_stocks entries
-            for us in user_stocks:
-                if us['stock_id'] == stock_id:
-                    link_news_to_user_stocks(db_connection, us['user_id'], us['stock_id'], news_ids)
-        else:
-            print(f"No news IDs returned for {symbol}, skipping linking.")
+    if lease is None:
+        handled = stocks
+        failed_stocks = ingest(stocks)
+    else:
+        handled, failed_stocks = ingest_leased_stocks(stocks, ingest, news_writer, journal, lease, args.claim_size)
+        metrics.count('leases_claimed', lease.claimed)
+        metrics.count('leases_stolen', lease.stolen)
 
-        print("-" * 30)
+    if failed_stocks:
+        print(f"{len(failed_stocks)} symbols still failed after {args.retries} retries: "
+              f"{', '.join(stock['symbol'] for stock in failed_stocks)}")
+        metrics.count('symbols_failed', len(failed_stocks))
 
+    # Features and the snapshot span every stock, so sharded workers leave them to
+    # the one that finds the cycle settled and wins the finalization lock.
+    finalize = lease is None or (lease.is_settled() and lease.acquire_finalize_lock())
+    if not finalize:
+        print("Other workers are still running or finalizing; leaving features and the snapshot to them.")
+    if finalize and not args.skip_features:
+        with metrics.stage('features'):
+            materialize_features(db_connection, full=args.full_backfill)
+    if finalize and not args.skip_snapshot:
+        with metrics.stage('snapshot'):
+            export_snapshot(db_connection, args.snapshot_dir, full=args.full_backfill)
+    if lease:
+        if finalize:
+            lease.release_finalize_lock()
+        print_shard_summary(db_connection, args.cycle)
+    news_writer.close()
+    if all(journal.is_complete(stock['id']) for stock in handled):
+        journal.finish()
+    else:
+        print(f"Run {journal.run_id} is incomplete; continue it with --resume.")
+    journal.close()
+    sentiment_engine.report()
+    sentiment_engine.close()
+    session.close()
     db_connection.close()
+    metrics.close()
     print("Script finished.")
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+# run_journal.py
+#
+# Resumability for populate_daily_prices.py.
+#
+# RunJournal records, under a run id, which stages of each stock have been
+# committed to the database: 'price' (stocks.price), 'history' (stocksdailyprice),
+# 'news' (news rows) and 'links' (user_stock_news). It lives in a local SQLite
+# file, so an interrupted run can be continued with --resume and only the missing
+# stages are redone.
+#
+# ResponseCache keeps upstream API responses on disk, keyed by URL and the
+# current date, for a TTL. Retries and re-runs on the same day read them from disk
+# instead of calling /api/stock/quote or /historical again.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import date
+
+from ingest_metrics import write_file_atomic
+
+DEFAULT_JOURNAL_PATH = os.getenv('INGEST_JOURNAL_PATH', '.ingest_journal.sqlite3')
+DEFAULT_CACHE_DIR = os.getenv('INGEST_CACHE_DIR', '.ingest_cache')
+DEFAULT_CACHE_TTL = float(os.getenv('INGEST_CACHE_TTL', '3600'))  # seconds, 0 disables the cache
+
+STAGES = ('price', 'history', 'news', 'links')
+
+class RunJournal:
+    """
+    Per-run, per-stock stage checkpoints in SQLite.
+
+    Call start() for a new run or resume() to continue an unfinished one, then
+    mark() checkpoints as their writes are committed, and finish() once every
+    stock has completed every stage.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                args TEXT
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id TEXT NOT NULL,
+                stock_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (run_id, stock_id, stage)
+            )
+        """)
+        self._db.commit()
+        self.run_id = None
+        self.completed = {}  # stock_id -> set of completed stages
+
+    def start(self, run_id, args=None):
+        """Starts journaling a new run."""
+        self._db.execute(
+            "INSERT INTO runs (run_id, started_at, args) VALUES (?, ?, ?)",
+            (run_id, time.time(), json.dumps(args, default=str))
+        )
+        self._db.commit()
+        self.run_id = run_id
+        self.completed = {}
+
+    def resume(self, run_id=None):
+        """
+        Continues the given run, or the latest unfinished one, loading its checkpoints.
+        Returns the run id, or None if there is nothing to resume.
+        """
+        if run_id is None:
+            row = self._db.execute(
+                "SELECT run_id FROM runs WHERE finished_at IS NULL ORDER BY started_at DESC LIMIT 1"
+            ).fetchone()
+        else:
+            row = self._db.execute("SELECT run_id FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+
+        self.run_id = row[0]
+        self.completed = {}
+        for stock_id, stage in self._db.execute(
+            "SELECT stock_id, stage FROM checkpoints WHERE run_id = ?", (self.run_id,)
+        ):
+            self.completed.setdefault(stock_id, set()).add(stage)
+        self._db.execute("UPDATE runs SET finished_at = NULL WHERE run_id = ?", (self.run_id,))
+        self._db.commit()
+        return self.run_id
+
+    def mark(self, checkpoints):
+        """Records (stock_id, stage) pairs as committed, in one transaction."""
+        checkpoints = list(checkpoints)
+        if not checkpoints:
+            return
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR IGNORE INTO checkpoints (run_id, stock_id, stage, completed_at) VALUES (?, ?, ?, ?)",
+            [(self.run_id, stock_id, stage, now) for stock_id, stage in checkpoints]
+        )
+        self._db.commit()
+        for stock_id, stage in checkpoints:
+            self.completed.setdefault(stock_id, set()).add(stage)
+
+    def is_complete(self, stock_id):
+        """True if every stage of the stock is committed."""
+        return self.completed.get(stock_id, set()).issuperset(STAGES)
+
+    def finish(self):
+        """Marks the run as finished, so --resume no longer picks it up."""
+        self._db.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+class ResponseCache:
+    """
+    On-disk cache of raw response bodies keyed by URL and the current date.
+    Entries older than `ttl` seconds are ignored and pruned; ttl <= 0 disables it.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self.prune()
+
+    def _path(self, url):
+        key = hashlib.sha1(f"{date.today().isoformat()}|{url}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key)
+
+    def prune(self):
+        """Deletes expired entries, including leftovers of interrupted writes."""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, url):
+        """Returns the path of a fresh cached body for `url`, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(url)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def read(self, url):
+        """Returns the cached body for `url` as bytes, or None."""
+        path = self.get(url)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def iter_chunks(self, path, chunk_size):
+        """Yields a cached body in chunks."""
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def put(self, url, body):
+        """Stores a complete response body."""
+        if not self.enabled:
+            return
+        write_file_atomic(self._path(url), body)
+
+    def tee(self, url, chunks):
+        """
+        Passes a streamed body through while writing it to the cache. The entry is only
+        stored once the stream is exhausted, so a partially read body is never cached.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{id(chunks)}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+            os.replace(tmp_path, path)
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,159 @@
+# sentiment_engine.py
+#
+# Headline sentiment scoring for the ingestion pipeline.
+#
+# Polarity is memoized by a hash of the normalized text in an on-disk SQLite
+# cache that is bounded to a maximum number of entries (least recently used
+# entries are evicted first). Texts that miss the cache are scored with
+# TextBlob, in batches on a process pool when there are enough of them to be
+# worth the overhead.
+#
+# Required packages:
+# pip install textblob
+
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from textblob import TextBlob
+
+DEFAULT_CACHE_PATH = os.getenv('SENTIMENT_CACHE_PATH', '.sentiment_cache.sqlite3')
+DEFAULT_CACHE_SIZE = int(os.getenv('SENTIMENT_CACHE_SIZE', '100000'))  # max cached entries
+MIN_PARALLEL_BATCH = 64  # below this many uncached texts, score inline
+POOL_CHUNK_SIZE = 32  # texts per task sent to a worker process
+
+def calculate_sentiment(text):
+    """Calculates sentiment score using TextBlob."""
+    analysis = TextBlob(text)
+    return analysis.sentiment.polarity # Polarity ranges from -1.0 (negative) to 1.0 (positive)
+
+def _score_batch(texts):
+    """Scores a list of texts; runs inside pool worker processes."""
+    return [calculate_sentiment(text) for text in texts]
+
+def normalize_text(text):
+    """Normalizes unicode form and whitespace so equivalent headlines share a cache entry."""
+    return " ".join(unicodedata.normalize('NFKC', text).split())
+
+def text_key(text):
+    """Returns the cache key for an already normalized text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class SentimentEngine:
+    """
+    Scores texts with a persistent memo cache and an optional process pool.
+
+    Call score() with a list of texts to get their polarities in the same order,
+    report() to print cache hit rate and throughput, and close() when done.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_CACHE_SIZE, workers=None):
+        self.max_entries = max(1, max_entries)
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._db = sqlite3.connect(cache_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_cache (
+                key TEXT PRIMARY KEY,
+                polarity REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS sentiment_cache_last_used ON sentiment_cache (last_used)")
+        self._db.commit()
+        self.stats = {'requested': 0, 'cache_hits': 0, 'scored': 0, 'score_seconds': 0.0}
+
+    def score(self, texts):
+        """Returns the polarity of each text, scoring only those missing from the cache."""
+        if not texts:
+            return []
+        self.stats['requested'] += len(texts)
+
+        keys = [text_key(normalize_text(text)) for text in texts]
+        polarities = self._lookup(set(keys))
+        self.stats['cache_hits'] += sum(1 for key in keys if key in polarities)
+
+        # Score each distinct uncached text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in polarities and key not in missing:
+                missing[key] = normalize_text(text)
+
+        if missing:
+            started = time.perf_counter()
+            scores = self._score_texts(list(missing.values()))
+            self.stats['score_seconds'] += time.perf_counter() - started
+            self.stats['scored'] += len(scores)
+            computed = dict(zip(missing.keys(), scores))
+            self._store(computed)
+            polarities.update(computed)
+
+        return [polarities[key] for key in keys]
+
+    def _score_texts(self, texts):
+        if len(texts) < MIN_PARALLEL_BATCH or self.workers == 1:
+            return _score_batch(texts)
+        if self._pool is None:
+            # Spawned, not forked: the pipeline calls this while fetch threads hold locks
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        chunks = [texts[i:i + POOL_CHUNK_SIZE] for i in range(0, len(texts), POOL_CHUNK_SIZE)]
+        return [score for chunk_scores in self._pool.map(_score_batch, chunks) for score in chunk_scores]
+
+    def _lookup(self, keys):
+        polarities = {}
+        keys = list(keys)
+        # SQLite limits bound parameters per statement, so look up in chunks
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = self._db.execute(
+                f"SELECT key, polarity FROM sentiment_cache WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            polarities.update(rows)
+        if polarities:
+            now = time.time()
+            self._db.executemany(
+                "UPDATE sentiment_cache SET last_used = ? WHERE key = ?",
+                [(now, key) for key in polarities]
+            )
+            self._db.commit()
+        return polarities
+
+    def _store(self, polarities):
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO sentiment_cache (key, polarity, last_used) VALUES (?, ?, ?)",
+            [(key, polarity, now) for key, polarity in polarities.items()]
+        )
+        (count,) = self._db.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM sentiment_cache WHERE key IN "
+                "(SELECT key FROM sentiment_cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self._db.commit()
+
+    def report(self):
+        """Prints cache hit rate and scoring throughput."""
+        requested = self.stats['requested']
+        if not requested:
+            print("Sentiment: no texts scored.")
+            return
+        hit_rate = self.stats['cache_hits'] / requested * 100
+        seconds = self.stats['score_seconds']
+        throughput = self.stats['scored'] / seconds if seconds > 0 else 0.0
+        print(f"Sentiment: {requested} texts, cache hit rate {hit_rate:.1f}%, "
+              f"{self.stats['scored']} scored in {seconds:.2f}s ({throughput:.0f} texts/sec, "
+              f"{self.workers} workers).")
+
+    def close(self):
+        """Shuts down the worker pool and closes the cache."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._db.close()
@@ -0,0 +1,296 @@
+# shard_lease.py
+#
+# Sharded ingestion for populate_daily_prices.py --shard i/N.
+#
+# Stocks are partitioned by a stable hash of their symbol into N shards. Every
+# worker seeds one ingest_lease row per stock for the current cycle (by default
+# the date) and claims batches of its own shard's rows by setting itself as owner
+# with an expiring lease. Claims are single UPDATE statements, so any number of
+# workers, on any number of hosts, can run at once without processing a stock
+# twice. Leases are renewed while a worker makes progress. A stalled or killed
+# worker stops renewing, so its lease expires and another worker can steal the
+# rows once its own shard is exhausted. A worker with nothing left to claim
+# while other rows are still leased polls until they are done or expire.
+#
+# When every row of the cycle is settled, the worker that gets the
+# GET_LOCK('moneygoup_ingest_finalize') advisory lock runs the features and
+# snapshot stages once for everyone.
+#
+# python populate_daily_prices.py --shard-status prints per-shard progress and skew.
+
+import argparse
+import os
+import socket
+import time
+import uuid
+import zlib
+from datetime import date
+
+from mysql.connector import Error
+
+DEFAULT_LEASE_SECONDS = int(os.getenv('INGEST_LEASE_SECONDS', '600'))
+DEFAULT_CLAIM_SIZE = int(os.getenv('INGEST_CLAIM_SIZE', '50'))  # stocks claimed per batch
+MAX_ATTEMPTS = 3  # claims per stock and cycle before it is left failed
+SEED_CHUNK_SIZE = 1000
+CLAIM_RETRIES = 3  # on lock wait timeouts / deadlocks between concurrent claims
+MAX_POLL_SECONDS = 30  # between claims while waiting on other workers' leases
+FINALIZE_LOCK = 'moneygoup_ingest_finalize'
+
+def parse_shard(spec):
+    """argparse type for 'i/N' (0 <= i < N); returns (i, N)."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..N-1, got {spec!r}")
+    return index, count
+
+def shard_of(symbol, shard_count):
+    """Stable shard of a symbol; the same on every host and Python process."""
+    return zlib.crc32(symbol.upper().encode('utf-8')) % shard_count
+
+def default_cycle():
+    return date.today().isoformat()
+
+class ShardLease:
+    """
+    Claims, renews, completes and releases ingest_lease rows of one cycle for a worker.
+    With steal=True, rows of other shards that are unclaimed or whose lease expired
+    are claimed once the worker's own shard has nothing left.
+    """
+
+    def __init__(self, connection, cycle, shard, shard_count, lease_seconds=DEFAULT_LEASE_SECONDS, steal=True):
+        self.connection = connection
+        self.cycle = cycle
+        self.shard = shard
+        self.shard_count = shard_count
+        self.lease_seconds = max(1, lease_seconds)
+        self.steal = steal
+        self.owner = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.last_heartbeat = time.monotonic()
+        self.claimed = 0
+        self.stolen = 0
+
+    def seed(self, stocks):
+        """Creates the cycle's lease row of every stock, keeping rows that already exist."""
+        rows = [(self.cycle, stock['id'], shard_of(stock['symbol'], self.shard_count)) for stock in stocks]
+        cursor = self.connection.cursor()
+        try:
+            for start in range(0, len(rows), SEED_CHUNK_SIZE):
+                chunk = rows[start:start + SEED_CHUNK_SIZE]
+                cursor.execute(
+                    "INSERT IGNORE INTO ingest_lease (cycle, stock_id, shard) VALUES "
+                    + ", ".join(["(%s, %s, %s)"] * len(chunk)),
+                    [value for row in chunk for value in row]
+                )
+            self.connection.commit()
+        except Error as e:
+            print(f"Error seeding ingest leases for cycle {self.cycle}: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+
+    def claim(self, limit):
+        """Claims up to `limit` stocks, own shard first. Returns their ids."""
+        stock_ids = self._claim(limit, own_shard=True)
+        if not stock_ids and self.steal:
+            stock_ids = self._claim(limit, own_shard=False)
+            self.stolen += len(stock_ids)
+            if stock_ids:
+                print(f"Shard {self.shard}/{self.shard_count} stole {len(stock_ids)} stocks from other shards.")
+        self.claimed += len(stock_ids)
+        self.last_heartbeat = time.monotonic()
+        return stock_ids
+
+    def _claim(self, limit, own_shard):
+        shard_condition = "AND shard = %s " if own_shard else ""
+        params = [self.owner, self.lease_seconds, self.cycle] + ([self.shard] if own_shard else []) + [MAX_ATTEMPTS, limit]
+        for attempt in range(CLAIM_RETRIES):
+            cursor = self.connection.cursor()
+            try:
+                # Ordered by stock_id so concurrent claims lock rows in the same order
+                cursor.execute(
+                    "UPDATE ingest_lease "
+                    "SET owner = %s, lease_until = NOW() + INTERVAL %s SECOND, attempts = attempts + 1 "
+                    f"WHERE cycle = %s {shard_condition}AND completed_at IS NULL AND attempts < %s "
+                    "AND (owner IS NULL OR lease_until < NOW()) "
+                    "ORDER BY stock_id LIMIT %s",
+                    params
+                )
+                cursor.execute(
+                    "SELECT stock_id FROM ingest_lease WHERE cycle = %s AND owner = %s AND completed_at IS NULL",
+                    (self.cycle, self.owner)
+                )
+                stock_ids = [row[0] for row in cursor.fetchall()]
+                self.connection.commit()
+                return stock_ids
+            except Error as e:
+                print(f"Error claiming stocks (attempt {attempt + 1} of {CLAIM_RETRIES}): {e}")
+                self.connection.rollback()
+            finally:
+                cursor.close()
+        return []
+
+    def heartbeat(self, force=False):
+        """Extends the leases of the claimed, unfinished stocks every third of the lease time."""
+        if not force and time.monotonic() - self.last_heartbeat < self.lease_seconds / 3:
+            return
+        self.last_heartbeat = time.monotonic()
+        self._execute(
+            "UPDATE ingest_lease SET lease_until = NOW() + INTERVAL %s SECOND "
+            "WHERE cycle = %s AND owner = %s AND completed_at IS NULL",
+            (self.lease_seconds, self.cycle, self.owner),
+            "renewing leases"
+        )
+
+    def complete(self, stock_ids):
+        """Marks claimed stocks as done for the cycle. Returns False if the update failed."""
+        return self._update_claimed("completed_at = NOW()", stock_ids, "completing leases")
+
+    def release(self, stock_ids):
+        """
+        Gives claimed stocks back, e.g. after they failed, so any worker may retry them.
+        Returns False if the update failed.
+        """
+        return self._update_claimed("owner = NULL, lease_until = NULL", stock_ids, "releasing leases")
+
+    def _update_claimed(self, assignments, stock_ids, action):
+        stock_ids = list(stock_ids)
+        if not stock_ids:
+            return True
+        placeholders = ", ".join(["%s"] * len(stock_ids))
+        return self._execute(
+            f"UPDATE ingest_lease SET {assignments} "
+            f"WHERE cycle = %s AND owner = %s AND stock_id IN ({placeholders})",
+            [self.cycle, self.owner] + stock_ids,
+            action
+        )
+
+    def _execute(self, query, params, action):
+        """Runs and commits one statement; False if it failed and was rolled back."""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"Error {action} for cycle {self.cycle}: {e}")
+            self.connection.rollback()
+            return False
+        finally:
+            cursor.close()
+
+    def is_settled(self, own_shard=False):
+        """
+        True if no stock of the cycle (or with own_shard=True, of this worker's shard) is
+        pending or held by a live lease; done stocks and expired ones out of attempts are
+        settled. Returns None if the database could not be asked.
+        """
+        shard_condition = "AND shard = %s " if own_shard else ""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT COUNT(*) FROM ingest_lease "
+                f"WHERE cycle = %s {shard_condition}AND completed_at IS NULL "
+                "AND (attempts < %s OR (owner IS NOT NULL AND lease_until >= NOW()))",
+                [self.cycle] + ([self.shard] if own_shard else []) + [MAX_ATTEMPTS]
+            )
+            (remaining,) = cursor.fetchone()
+            self.connection.commit()
+            return remaining == 0
+        except Error as e:
+            print(f"Error checking whether cycle {self.cycle} is settled: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def wait_for_leases(self):
+        """
+        After a claim came back empty: waits until the stocks other workers hold are done
+        or can be claimed. Returns False once there is nothing left to wait for (only the
+        own shard counts without stealing) or the database is unreachable.
+        """
+        settled = self.is_settled(own_shard=not self.steal)
+        if settled is not False:
+            return False
+        delay = min(self.lease_seconds / 3, MAX_POLL_SECONDS)
+        print(f"Waiting {delay:.0f}s for stocks leased by other workers to finish or expire...")
+        time.sleep(delay)
+        return True
+
+    def acquire_finalize_lock(self):
+        """Tries the finalization advisory lock without waiting; True if this worker holds it."""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (FINALIZE_LOCK,))
+            (acquired,) = cursor.fetchone()
+            return acquired == 1
+        except Error as e:
+            print(f"Error acquiring the {FINALIZE_LOCK} lock: {e}")
+            return False
+        finally:
+            cursor.close()
+
+    def release_finalize_lock(self):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (FINALIZE_LOCK,))
+            cursor.fetchone()
+        except Error as e:
+            print(f"Error releasing the {FINALIZE_LOCK} lock: {e}")
+        finally:
+            cursor.close()
+
+def shard_progress(connection, cycle):
+    """Returns per-shard lease counts for a cycle, ordered by shard."""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT shard,
+                   COUNT(*) AS stocks,
+                   SUM(completed_at IS NOT NULL) AS completed,
+                   SUM(completed_at IS NULL AND owner IS NOT NULL AND lease_until >= NOW()) AS in_progress,
+                   SUM(completed_at IS NULL AND owner IS NOT NULL AND lease_until < NOW()) AS expired,
+                   SUM(completed_at IS NULL AND owner IS NULL AND attempts >= %s) AS failed,
+                   SUM(completed_at IS NULL AND owner IS NULL AND attempts < %s) AS pending,
+                   COUNT(DISTINCT CASE WHEN lease_until >= NOW() THEN owner END) AS active_workers,
+                   MAX(completed_at) AS last_completed_at
+            FROM ingest_lease
+            WHERE cycle = %s
+            GROUP BY shard
+            ORDER BY shard
+        """, (MAX_ATTEMPTS, MAX_ATTEMPTS, cycle))
+        rows = cursor.fetchall()
+        connection.commit()
+        # SUM() comes back as Decimal
+        return [{key: value if key == 'last_completed_at' else int(value) for key, value in row.items()} for row in rows]
+    finally:
+        cursor.close()
+
+def print_shard_summary(connection, cycle):
+    """Prints per-shard progress, and the skew of shard sizes and of completion across shards."""
+    try:
+        shards = shard_progress(connection, cycle)
+    except Error as e:
+        print(f"Error reading shard progress for cycle {cycle}: {e}")
+        return
+    if not shards:
+        print(f"No sharded work recorded for cycle {cycle}.")
+        return
+
+    print(f"\nShard progress for cycle {cycle}:")
+    print(f"  {'shard':>5} {'stocks':>7} {'done':>7} {'running':>8} {'expired':>8} {'failed':>7} "
+          f"{'pending':>8} {'workers':>8} {'done %':>7}  last completed")
+    for row in shards:
+        percent = row['completed'] / row['stocks'] * 100 if row['stocks'] else 100.0
+        print(f"  {row['shard']:>5} {row['stocks']:>7} {row['completed']:>7} {row['in_progress']:>8} "
+              f"{row['expired']:>8} {row['failed']:>7} {row['pending']:>8} {row['active_workers']:>8} "
+              f"{percent:>6.1f}%  {row['last_completed_at'] or '-'}")
+
+    sizes = [row['stocks'] for row in shards]
+    percents = [row['completed'] / row['stocks'] * 100 if row['stocks'] else 100.0 for row in shards]
+    mean_size = sum(sizes) / len(sizes)
+    slowest = shards[percents.index(min(percents))]['shard']
+    print(f"  Size skew: largest shard is {max(sizes) / mean_size:.2f}x the mean of {mean_size:.0f} stocks.")
+    print(f"  Progress skew: {max(percents) - min(percents):.1f} points between shards (slowest: shard {slowest}).")
@@ -4,7 +4,7 @@ import { createLogger } from '@/utils/logger';
 import { NextRequest, NextResponse } from 'next/server';
 import { executeRawQuery } from '@/utils/databaseHelper';
 import { checkOrigin } from '@/utils/originCheck';
-import { calculateTechnicalIndicators, HistoricalData } from '@/utils/technicalIndicators';
+import { calculateTechnicalIndicators, HistoricalData, PrecomputedIndicators } from '@/utils/technicalIndicators';
 import { createErrorResponse } from '@/utils/errorResponse';
 
 interface DailyPriceRow {
@@ -16,6 +16,16 @@ interface DailyPriceRow {
   high: string;
   low: string;
 }
+
+interface FeatureRow {
+  stock_id: number;
+  close: string;
+  sma20: number | null;
+  sma50: number | null;
+  rsi14: number | null;
+  momentum10: number | null;
+  volatility: number | null;
+}
 const logger = createLogger('api/dashboard');
 
 export async function GET(request: NextRequest) {
@@ -116,13 +126,45 @@ export async function GET(request: NextRequest) {
 
 
 
-    // 2. Fetch all historical prices, ordered by date for each stock
+    // Latest price date of each of the user's stocks; features are only used when they reach it
+    const latestPriceDates = `
+        SELECT stock_id, MAX(date) AS max_date
+        FROM stocksdailyprice
+        WHERE stock_id IN (SELECT stock_id FROM user_stocks WHERE user_id = ?)
+        GROUP BY stock_id
+    `;
+
+    // 2a. Fetch the precomputed indicators of each stock's latest bar (see compute_features.py)
+    const [featuresResult] = await executeRawQuery(`
+        SELECT f.stock_id, p.\`close\`, f.sma20, f.sma50, f.rsi14, f.momentum10, f.volatility
+        FROM (${latestPriceDates}) latest
+        JOIN stocksdailyfeature f ON f.stock_id = latest.stock_id AND f.date = latest.max_date
+        JOIN stocksdailyprice p ON p.stock_id = f.stock_id AND p.date = f.date;
+    `, [userId]);
+    const precomputedByStockId = new Map<number, PrecomputedIndicators>(
+      (featuresResult as FeatureRow[]).map(row => [row.stock_id, {
+        close: parseFloat(row.close),
+        sma20: row.sma20,
+        sma50: row.sma50,
+        rsi14: row.rsi14,
+        momentum: row.momentum10,
+        volatility: row.volatility,
+      }])
+    );
+
+    // 2b. Fetch full historical prices, ordered by date, only for stocks whose features are
+    // missing or stale (compute_features.py has not run since their latest price was written)
     const [pricesResult] = await executeRawQuery(`
         SELECT stock_id, date, \`close\`, volume, \`open\`, \`high\`, \`low\`
         FROM stocksdailyprice
         WHERE stock_id IN (SELECT stock_id FROM user_stocks WHERE user_id = ?)
+          AND stock_id NOT IN (
+              SELECT f.stock_id
+              FROM (${latestPriceDates}) latest
+              JOIN stocksdailyfeature f ON f.stock_id = latest.stock_id AND f.date = latest.max_date
+          )
         ORDER BY stock_id, date ASC;
-    `, [userId]);
+    `, [userId, userId]);
     const dailyPrices = pricesResult as DailyPriceRow[];
 
     // 3. Fetch news data for the user's stocks
@@ -186,7 +228,8 @@ export async function GET(request: NextRequest) {
         stockNews,
         peRatio, // Pass parsed values
         pbRatio, // Pass parsed values
-        marketCap  // Pass parsed values
+        marketCap,  // Pass parsed values
+        precomputedByStockId.get(stock.id)
       );
 
       const currentPrice = parseFloat(stock.current_price || '0');
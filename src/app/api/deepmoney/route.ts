@@ -8,23 +8,58 @@ const sentiment = new Sentiment();
 // Assuming the news endpoint is hosted on the same instance
 const NEWS_API_URL = `${process.env.NEXTAUTH_URL}/api/deepmoney/news`;
 
-// Load tickers from the public file
-import tickers from '@/../../public/company_tickers.json';
-
-interface Ticker {
-    ticker: string;
-    name: string;
+// Prebuilt by update_tickers.py: normalized company names in match order and an n-gram index over them
+import tickerIndex from '@/../../public/company_tickers_index.json';
+
+interface TickerIndex {
+    ngramSize: number;
+    names: string[];
+    tickers: string[];
+    ngrams: { [gram: string]: number[] };
 }
 
-const tickerMap: { [key: string]: { ticker: string, name: string } } = {};
-(tickers as Ticker[]).forEach(t => {
-    if (t.name) {
-        const normalizedName = t.name.toLowerCase()
-            .replace(/,?\s+(inc|corporation|corp|ltd|llc)\.?/g, '')
-            .trim();
-        tickerMap[normalizedName] = { ticker: t.ticker, name: t.name };
+const { ngramSize, names, tickers, ngrams } = tickerIndex as TickerIndex;
+
+const MATCH_CACHE_SIZE = 10000;
+const matchCache = new Map<string, string | null>();
+
+// Returns the ticker of the first company name containing orgLower. A name containing
+// orgLower contains all of its n-grams, so only the names listed under its rarest
+// n-gram are checked; shorter strings fall back to a full scan.
+function findTicker(orgLower: string): string | null {
+    const cached = matchCache.get(orgLower);
+    if (cached !== undefined) {
+        return cached;
+    }
+
+    const chars = Array.from(orgLower); // code points, like the Python index builder
+    let candidates: number[] | null = null;
+    for (let i = 0; i + ngramSize <= chars.length; i++) {
+        const positions = ngrams[chars.slice(i, i + ngramSize).join('')];
+        if (!positions) {
+            candidates = [];
+            break;
+        }
+        if (!candidates || positions.length < candidates.length) {
+            candidates = positions;
+        }
     }
-});
+
+    let ticker: string | null = null;
+    if (candidates) {
+        const position = candidates.find(p => names[p].includes(orgLower));
+        ticker = position === undefined ? null : tickers[position];
+    } else {
+        const position = names.findIndex(name => name.includes(orgLower));
+        ticker = position === -1 ? null : tickers[position];
+    }
+
+    if (matchCache.size >= MATCH_CACHE_SIZE) {
+        matchCache.clear();
+    }
+    matchCache.set(orgLower, ticker);
+    return ticker;
+}
 
 const industries = {
     'Gold': ['gold', 'precious metals'],
@@ -62,12 +97,9 @@ export async function GET() {
 
             for (const org of organizations) {
                 const orgLower = org.toLowerCase().replace(/,$/, '');
-                for (const normalizedName in tickerMap) {
-                    if (normalizedName.includes(orgLower)) {
-                        const ticker = tickerMap[normalizedName].ticker;
-                        organizationCounts[ticker] = (organizationCounts[ticker] || 0) + 1;
-                        break; 
-                    }
+                const ticker = findTicker(orgLower);
+                if (ticker) {
+                    organizationCounts[ticker] = (organizationCounts[ticker] || 0) + 1;
                 }
             }
 
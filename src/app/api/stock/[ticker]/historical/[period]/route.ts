@@ -173,7 +173,12 @@ export async function GET(
 
   const days = getDays(period)
 
-  const startDate = new Date(Date.now() - days * 24 * 60 * 60 * 1000).toISOString().slice(0, 10)
+  // An explicit ?start=YYYY-MM-DD (used by incremental ingestion) overrides the period window
+  const startParam = request.nextUrl.searchParams.get('start')
+
+  const startDate = startParam && /^\d{4}-\d{2}-\d{2}$/.test(startParam)
+    ? startParam
+    : new Date(Date.now() - days * 24 * 60 * 60 * 1000).toISOString().slice(0, 10)
 
 
 
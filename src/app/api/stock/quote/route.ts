@@ -0,0 +1,75 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { createLogger } from '@/utils/logger';
+import { createErrorResponse } from '@/utils/errorResponse';
+import { checkOrigin } from '@/utils/originCheck';
+import YahooFinance from 'yahoo-finance2';
+
+const logger = createLogger('api/stock/quote');
+const yahooFinance = new YahooFinance();
+
+// Symbols per request; larger batches are split by the caller
+const MAX_SYMBOLS = 100;
+
+// GET /api/stock/quote?symbols=AAPL,MSFT,...
+// Batch variant of /api/stock/quote/[ticker]: real-time prices for many symbols in one Yahoo lookup.
+export async function GET(request: NextRequest) {
+  const originCheckResponse = checkOrigin(request);
+  if (originCheckResponse) {
+    return originCheckResponse;
+  }
+
+  const symbols = Array.from(new Set(
+    (request.nextUrl.searchParams.get('symbols') || '')
+      .split(',')
+      .map(symbol => symbol.trim())
+      .filter(symbol => symbol.length > 0)
+  ));
+
+  if (symbols.length === 0) {
+    return createErrorResponse(
+      new Error('At least one stock symbol is required'),
+      400
+    );
+  }
+  if (symbols.length > MAX_SYMBOLS) {
+    return createErrorResponse(
+      new Error(`At most ${MAX_SYMBOLS} symbols can be quoted per request, got ${symbols.length}`),
+      400
+    );
+  }
+
+  try {
+    logger.info(`Fetching real-time quotes for ${symbols.length} symbols`);
+
+    // Symbols Yahoo does not know are left out of the result rather than failing the batch
+    const results = await yahooFinance.quote(symbols);
+    const pricesBySymbol = new Map<string, number>();
+    for (const result of results) {
+      if (result.symbol && result.regularMarketPrice) {
+        pricesBySymbol.set(result.symbol.toUpperCase(), result.regularMarketPrice);
+      }
+    }
+
+    const quotes: { symbol: string; price: number }[] = [];
+    const missing: string[] = [];
+    for (const symbol of symbols) {
+      const price = pricesBySymbol.get(symbol.toUpperCase());
+      if (price === undefined) {
+        missing.push(symbol);
+      } else {
+        quotes.push({ symbol, price });
+      }
+    }
+    if (missing.length > 0) {
+      logger.warn(`No real-time price found for: ${missing.join(', ')}`);
+    }
+
+    return NextResponse.json({ quotes, missing }, { status: 200 });
+  } catch (error: any) {
+    logger.error(`Error fetching real-time quotes for ${symbols.join(', ')}:`, error);
+    return createErrorResponse(
+      error,
+      500
+    );
+  }
+}
@@ -46,6 +46,19 @@ export interface TechnicalIndicators {
   volatility: "Low" | "Medium" | "High" | "N/A" | null;
 }
 
+/**
+ * Indicator values materialized by compute_features.py into stocksdailyfeature
+ * for a stock's latest bar. `volatility` is the annualized volatility percentage.
+ */
+export interface PrecomputedIndicators {
+  close: number
+  sma20: number | null
+  sma50: number | null
+  rsi14: number | null
+  momentum: number | null
+  volatility: number | null
+}
+
 export interface IndicatorSnapshot {
   date: string
   close: number
@@ -459,6 +472,7 @@ function generateSignal(
 /**
  * Main function to calculate all technical indicators
  * @param historicalData Array of historical OHLCV data
+ * @param precomputed Materialized indicator values; when given, historicalData is not used
  * @returns TechnicalIndicators object with all calculated values, trading signal, and scoring breakdown
  */
 export function calculateTechnicalIndicators(
@@ -466,9 +480,10 @@ export function calculateTechnicalIndicators(
   newsData: { sentiment_score: number; pub_date: string }[],
   peRatio: number | undefined,
   pbRatio: number | undefined,
-  marketCap: number | undefined
+  marketCap: number | undefined,
+  precomputed?: PrecomputedIndicators
 ): TechnicalIndicators {
-  if (!historicalData || historicalData.length === 0) {
+  if (!precomputed && (!historicalData || historicalData.length === 0)) {
     const emptyBreakdown: ScoreBreakdown = {
       maScore: 0,
       maReason: 'Insufficient data',
@@ -505,17 +520,29 @@ export function calculateTechnicalIndicators(
     }
   }
 
-  const prices = historicalData.map(d => d.close)
-  const currentPrice = prices[prices.length - 1]
+  let currentPrice: number
+  let sma20: number | null
+  let sma50: number | null
+  let rsi14: number | null
+  let momentum: number | null
+  let annualizedVolatility: number | null
 
-  // Calculate all indicators
-  const sma20 = calculateSMA(prices, 20)
-  const sma50 = calculateSMA(prices, 50)
-  const rsi14 = calculateRSI(prices, 14)
-  const momentum = calculateMomentum(prices, 10)
+  if (precomputed) {
+    // Use the values materialized after ingestion
+    ({ close: currentPrice, sma20, sma50, rsi14, momentum, volatility: annualizedVolatility } = precomputed)
+  } else {
+    const prices = historicalData.map(d => d.close)
+    currentPrice = prices[prices.length - 1]
+
+    // Calculate all indicators
+    sma20 = calculateSMA(prices, 20)
+    sma50 = calculateSMA(prices, 50)
+    rsi14 = calculateRSI(prices, 14)
+    momentum = calculateMomentum(prices, 10)
 
-  // Calculate volatility
-  const annualizedVolatility = calculateAnnualizedVolatility(historicalData.map(d => ({ date: d.date || d.datetime || '', close: d.close })));
+    // Calculate volatility
+    annualizedVolatility = calculateAnnualizedVolatility(historicalData.map(d => ({ date: d.date || d.datetime || '', close: d.close })));
+  }
   const volatilityRating = getVolatilityRating(annualizedVolatility);
 
   // Calculate news sentiment
@@ -26,7 +26,8 @@ export function calculateAnnualizedVolatility(prices: HistoricalPrice[]): number
     }
   }
 
-  if (logReturns.length === 0) {
+  // The sample variance needs at least 2 returns (compute_features.py stores NULL then too)
+  if (logReturns.length < 2) {
     return null;
   }
 
@@ -0,0 +1,128 @@
+# test_bulk_price_writer.py
+#
+# Checks that a BulkPriceWriter batch with one bad stock only fails that stock.
+# The fake connection stands in for MySQL's strict mode: any statement that writes
+# a daily price row without a close fails, and a rollback discards the transaction.
+#
+# Run from the repository root:
+# python -m pytest tests
+
+from datetime import date
+
+import pytest
+
+for module in ('mysql.connector', 'dotenv', 'requests', 'numpy', 'textblob'):
+    pytest.importorskip(module)
+
+from mysql.connector import Error
+
+from ingest_metrics import RunMetrics
+from populate_daily_prices import DAILY_PRICE_COLUMNS, BulkPriceWriter
+from run_journal import RunJournal
+
+CLOSE = DAILY_PRICE_COLUMNS.index('close')
+
+class FakeConnection:
+    def __init__(self):
+        self.prices = {}  # (stock_id, date) -> row, committed
+        self.stock_prices = {}
+        self.staging = []
+        self.pending = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        for kind, value in self.pending:
+            if kind == 'row':
+                self.prices[value[0], value[1]] = value
+            elif kind == 'price':
+                self.stock_prices.update(value)
+            else:
+                self.staging = value
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        params = list(params)
+        if query.startswith('INSERT INTO stocksdailyprice') and 'SELECT' not in query:
+            width = len(DAILY_PRICE_COLUMNS)
+            rows = [tuple(params[i:i + width]) for i in range(0, len(params), width)]
+            self._write_rows(rows)
+        elif query.startswith('INSERT INTO stocksdailyprice'):
+            loaded = [value for kind, value in self.connection.pending if kind == 'staging']
+            staging = loaded[-1] if loaded else self.connection.staging
+            staged = [row for row in staging if row[0] in params]
+            self._write_rows(staged)
+        elif query.startswith('UPDATE stocks SET price'):
+            pairs = params[:len(params) * 2 // 3]
+            self.connection.pending.append(('price', dict(zip(pairs[::2], pairs[1::2]))))
+        elif query.startswith('LOAD DATA'):
+            with open(params[0]) as f:
+                rows = [
+                    tuple(None if value == r'\N' else value for value in line.rstrip('\n').split('\t'))
+                    for line in f
+                ]
+            self.connection.pending.append(('staging', [(int(row[0]),) + row[1:] for row in rows]))
+        self.rowcount = 1
+
+    def _write_rows(self, rows):
+        if any(row[CLOSE] is None for row in rows):
+            raise Error("Column 'close' cannot be null")
+        self.connection.pending.extend(('row', row) for row in rows)
+
+    def close(self):
+        pass
+
+def price_row(stock_id, day, close):
+    row = [None] * len(DAILY_PRICE_COLUMNS)
+    row[0], row[1], row[CLOSE] = stock_id, date(2024, 1, day).isoformat(), close
+    return tuple(row)
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.sqlite3'))
+    journal.start('test-run')
+    yield journal
+    journal.close()
+
+def add_stocks(writer, bad_stock_id, staged=False):
+    for stock_id in range(1, 9):
+        close = None if stock_id == bad_stock_id else 10.0 + stock_id
+        writer.add_daily_prices([price_row(stock_id, day, close) for day in (2, 3)], staged=staged)
+        if not staged:
+            writer.add_stock_price(stock_id, 20.0 + stock_id)
+        writer.add_checkpoint(stock_id, 'history')
+
+def test_a_bad_row_only_fails_its_own_stock(journal):
+    connection = FakeConnection()
+    writer = BulkPriceWriter(connection, RunMetrics('test'), batch_size=1000, flush_interval=3600, journal=journal)
+
+    add_stocks(writer, bad_stock_id=5)
+    writer.close()
+
+    assert writer.failed_stock_ids == {5}
+    assert {stock_id for stock_id, _ in connection.prices} == {1, 2, 3, 4, 6, 7, 8}
+    assert set(connection.stock_prices) == {1, 2, 3, 4, 6, 7, 8}
+    assert sorted(journal.completed) == [1, 2, 3, 4, 6, 7, 8]
+
+def test_a_bad_staged_row_only_fails_its_own_stock(journal):
+    connection = FakeConnection()
+    writer = BulkPriceWriter(
+        connection, RunMetrics('test'), batch_size=1000, flush_interval=3600,
+        use_load_data=True, journal=journal
+    )
+
+    add_stocks(writer, bad_stock_id=2, staged=True)
+    writer.close()
+
+    assert writer.failed_stock_ids == {2}
+    assert {stock_id for stock_id, _ in connection.prices} == {1, 3, 4, 5, 6, 7, 8}
+    assert sorted(journal.completed) == [1, 3, 4, 5, 6, 7, 8]
@@ -0,0 +1,128 @@
+# test_compute_features.py
+#
+# Parity checks between compute_features.py and the TypeScript indicators it
+# materializes for the dashboard. The reference functions below are line-for-line
+# ports of calculateSMA, calculateRSI and calculateMomentum from
+# src/utils/technicalIndicators.ts and calculateAnnualizedVolatility from
+# src/utils/volatility.ts; keep them in step with those files.
+#
+# Run from the repository root:
+# python -m pytest tests
+
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('mysql.connector')
+
+import compute_features as cf
+
+def js_round(value):
+    """Math.round: halves round toward +infinity."""
+    return math.floor(value + 0.5)
+
+def calculate_sma(prices, period):
+    if len(prices) < period:
+        return None
+    return sum(prices[-period:]) / period
+
+def calculate_rsi(prices, period=14):
+    if len(prices) < period + 1:
+        return None
+    changes = [prices[i] - prices[i - 1] for i in range(1, len(prices))]
+    gains = [c if c > 0 else 0 for c in changes]
+    losses = [-c if c < 0 else 0 for c in changes]
+    avg_gain = sum(gains[-period:]) / period
+    avg_loss = sum(losses[-period:]) / period
+    if avg_loss == 0:
+        return 100
+    rs = avg_gain / avg_loss
+    return js_round((100 - 100 / (1 + rs)) * 100) / 100
+
+def calculate_momentum(prices, period=10):
+    if len(prices) < period + 1:
+        return None
+    return js_round((prices[-1] - prices[-1 - period]) * 100) / 100
+
+def calculate_annualized_volatility(prices):
+    if len(prices) < 2:
+        return None
+    log_returns = [
+        math.log(prices[i] / prices[i - 1])
+        for i in range(1, len(prices))
+        if prices[i] > 0 and prices[i - 1] > 0
+    ]
+    if len(log_returns) < 2:
+        return None
+    mean = sum(log_returns) / len(log_returns)
+    variance = sum((r - mean) ** 2 for r in log_returns) / (len(log_returns) - 1)
+    return math.sqrt(variance) * math.sqrt(252) * 100
+
+def reference_features(closes):
+    """The TS indicators for every prefix of `closes`, as the dashboard computes them per bar."""
+    return [
+        {
+            'sma20': calculate_sma(closes[:i + 1], 20),
+            'sma50': calculate_sma(closes[:i + 1], 50),
+            'rsi14': calculate_rsi(closes[:i + 1], 14),
+            'momentum10': calculate_momentum(closes[:i + 1], 10),
+            'volatility': calculate_annualized_volatility(closes[:i + 1]),
+        }
+        for i in range(len(closes))
+    ]
+
+def random_walk(rng, length):
+    closes = [rng.uniform(5, 500)]
+    for _ in range(length - 1):
+        closes.append(round(closes[-1] * math.exp(rng.gauss(0, 0.02)), 4))
+    return closes
+
+def assert_matches(features, row, expected):
+    for column, value in expected.items():
+        actual = features[column][row]
+        if value is None:
+            assert np.isnan(actual), (column, row, actual)
+        else:
+            assert actual == pytest.approx(value, rel=1e-9, abs=1e-9), (column, row)
+
+@pytest.fixture
+def histories():
+    rng = random.Random(20240101)
+    # Lengths straddle every indicator's warm-up so the null boundaries are covered
+    return {stock_id: random_walk(rng, length) for stock_id, length in
+            zip(range(1, 8), (1, 2, 11, 15, 20, 50, 180))}
+
+def test_full_mode_matches_typescript(histories):
+    stock_ids = np.array([s for s, closes in histories.items() for _ in closes], dtype=np.int64)
+    closes = np.array([c for closes in histories.values() for c in closes], dtype=np.float64)
+    features = cf.compute_features(stock_ids, closes, np.ones(len(closes), dtype=bool), {})
+
+    row = 0
+    for stock_closes in histories.values():
+        for expected in reference_features(stock_closes):
+            assert_matches(features, row, expected)
+            row += 1
+
+@pytest.mark.parametrize('split', [1, 12, 49, 51, 120])
+def test_incremental_mode_matches_typescript(histories, split):
+    stock_closes = histories[7]
+    expected = reference_features(stock_closes)
+
+    # The stored state of the last materialized bar, as fetch_feature_states returns it
+    head = np.array(stock_closes[:split], dtype=np.float64)
+    head_features = cf.compute_features(
+        np.full(len(head), 7, dtype=np.int64), head, np.ones(len(head), dtype=bool), {}
+    )
+    state = tuple(float(head_features[column][-1])
+                  for column in ('log_return_count', 'log_return_sum', 'log_return_sumsq'))
+
+    # The window fetch_price_window returns: LOOKBACK_BARS bars of context, then the new bars
+    start = max(0, split - cf.LOOKBACK_BARS)
+    window = np.array(stock_closes[start:], dtype=np.float64)
+    is_new = np.arange(start, len(stock_closes)) >= split
+    features = cf.compute_features(np.full(len(window), 7, dtype=np.int64), window, is_new, {7: state})
+
+    for row in np.flatnonzero(is_new):
+        assert_matches(features, row, expected[start + row])
@@ -0,0 +1,116 @@
+# test_ingest_leased_stocks.py
+#
+# Drives the sharded worker loop of populate_daily_prices.py against an in-memory
+# stand-in for ingest_lease that claims, completes and releases rows the way the
+# UPDATE statements in shard_lease.py do.
+#
+# Run from the repository root:
+# python -m pytest tests
+
+import pytest
+
+for module in ('mysql.connector', 'dotenv', 'requests', 'numpy', 'textblob'):
+    pytest.importorskip(module)
+
+from populate_daily_prices import ingest_leased_stocks
+from run_journal import STAGES, RunJournal
+from shard_lease import MAX_ATTEMPTS
+
+class FakeLease:
+    """One worker's view of a single-shard cycle; `fail_updates` makes complete/release fail."""
+
+    def __init__(self, fail_updates=False):
+        self.rows = {}
+        self.fail_updates = fail_updates
+
+    def seed(self, stocks):
+        for stock in stocks:
+            self.rows.setdefault(stock['id'], {'owner': None, 'attempts': 0, 'completed': False})
+
+    def claim(self, limit):
+        claimable = [
+            stock_id for stock_id, row in sorted(self.rows.items())
+            if not row['completed'] and row['attempts'] < MAX_ATTEMPTS and row['owner'] is None
+        ]
+        for stock_id in claimable[:limit]:
+            self.rows[stock_id].update(owner='me', attempts=self.rows[stock_id]['attempts'] + 1)
+        return [stock_id for stock_id, row in sorted(self.rows.items()) if row['owner'] == 'me' and not row['completed']]
+
+    def complete(self, stock_ids):
+        return self._update(stock_ids, completed=True)
+
+    def release(self, stock_ids):
+        return self._update(stock_ids, owner=None)
+
+    def _update(self, stock_ids, **values):
+        if self.fail_updates:
+            return False
+        for stock_id in stock_ids:
+            if self.rows[stock_id]['owner'] == 'me':
+                self.rows[stock_id].update(values)
+        return True
+
+    def wait_for_leases(self):
+        return False
+
+class FakeNewsWriter:
+    def close(self):
+        pass
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.sqlite3'))
+    journal.start('test-run')
+    yield journal
+    journal.close()
+
+def make_ingest(journal, failing_ids, calls):
+    def ingest(batch, lease):
+        calls.append([stock['id'] for stock in batch])
+        journal.mark((stock['id'], stage) for stock in batch if stock['id'] not in failing_ids for stage in STAGES)
+        return [stock for stock in batch if stock['id'] in failing_ids]
+    return ingest
+
+STOCKS = [{'id': stock_id, 'symbol': f'S{stock_id}'} for stock_id in range(1, 7)]
+
+def test_a_batch_where_every_stock_fails_does_not_stop_the_worker(journal):
+    lease = FakeLease()
+    calls = []
+    # The first batch fails as a whole, so its ids are the lowest claimable rows again
+    ingest = make_ingest(journal, {1, 2}, calls)
+
+    handled, failed = ingest_leased_stocks(STOCKS, ingest, FakeNewsWriter(), journal, lease, claim_size=2)
+
+    assert calls[:MAX_ATTEMPTS] == [[1, 2]] * MAX_ATTEMPTS
+    assert calls[MAX_ATTEMPTS:] == [[3, 4], [5, 6]]
+    assert [stock['id'] for stock in failed] == [1, 2]
+    assert sorted(stock['id'] for stock in handled) == [1, 2, 3, 4, 5, 6]
+    assert all(row['completed'] for stock_id, row in lease.rows.items() if stock_id > 2)
+    # Out of attempts and released, so the cycle can settle
+    assert all(lease.rows[stock_id] == {'owner': None, 'attempts': MAX_ATTEMPTS, 'completed': False}
+               for stock_id in (1, 2))
+
+def test_a_stock_that_recovers_is_not_reported_failed(journal):
+    lease = FakeLease()
+    calls = []
+    failing = {6}
+    ingest = make_ingest(journal, failing, calls)
+
+    def flaky(batch, lease):
+        result = ingest(batch, lease)
+        failing.clear()  # only the first attempt fails
+        return result
+
+    handled, failed = ingest_leased_stocks(STOCKS, flaky, FakeNewsWriter(), journal, lease, claim_size=4)
+
+    assert failed == []
+    assert all(row['completed'] for row in lease.rows.values())
+
+def test_the_worker_stops_when_its_leases_cannot_be_updated(journal):
+    lease = FakeLease(fail_updates=True)
+    calls = []
+    ingest = make_ingest(journal, set(), calls)
+
+    ingest_leased_stocks(STOCKS, ingest, FakeNewsWriter(), journal, lease, claim_size=2)
+
+    assert calls == [[1, 2]]
@@ -0,0 +1,80 @@
+# trading_calendar.py
+#
+# NYSE/NASDAQ trading-day calendar: weekdays minus the regular full-day market
+# holidays. One-off closures (national days of mourning, weather) are not included.
+
+from datetime import date, timedelta
+from functools import lru_cache
+
+def _easter_sunday(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def _nth_weekday(year, month, weekday, n):
+    """The n-th given weekday (0=Monday) of a month; n=-1 for the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(holiday):
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday."""
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+@lru_cache(maxsize=None)
+def market_holidays(year):
+    """Returns the set of weekday market holidays in a year."""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),   # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),   # Washington's Birthday
+        _easter_sunday(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(date(year, 7, 4)),   # Independence Day
+        _nth_weekday(year, 9, 0, 1),   # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        _observed(date(year, 12, 25)), # Christmas Day
+    }
+    # New Year's Day falling on a Saturday is not observed on the prior Friday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return frozenset(day for day in holidays if day.year == year)
+
+def is_trading_day(day):
+    """True if the market is open on `day`."""
+    return day.weekday() < 5 and day not in market_holidays(day.year)
+
+def previous_trading_day(day):
+    """The last trading day strictly before `day`."""
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+def next_trading_day(day):
+    """The first trading day strictly after `day`."""
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+def holidays_between(start_year, end_year):
+    """Sorted list of market holidays from start_year through end_year, e.g. for numpy.busday_count."""
+    return sorted(day for year in range(start_year, end_year + 1) for day in market_holidays(year))
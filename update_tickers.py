@@ -1,32 +1,209 @@
+# update_tickers.py
+#
+# Refreshes public/company_tickers.json (the NYSE/NASDAQ ticker universe) and the
+# prebuilt name index public/company_tickers_index.json used by /api/deepmoney.
+#
+# The download is a conditional GET (If-None-Match / If-Modified-Since, validators
+# kept in --state-file), and nothing is rewritten when the content is unchanged.
+# Files are written compactly and atomically (temp file + rename), so the app never
+# reads a half-written file.
+#
+# The name index holds every company name normalized the way deepmoney matches
+# them, in match order, plus a trigram -> name positions map. A lookup only checks
+# the names sharing the rarest trigram of the organization instead of scanning the
+# whole universe.
+#
+# Required packages:
+# pip install requests
+#
+# To run:
+# python update_tickers.py [--rebuild-index]
+
+import argparse
 import json
 import requests
 import os
+import re
+import time
+
+from ingest_metrics import DEFAULT_EVENTS_PATH, DEFAULT_TEXTFILE_DIR, RunMetrics, write_file_atomic
+
+SEC_TICKERS_URL = "https://dumbstockapi.com/stock?exchanges=NYSE,NASDAQ&format=json"
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public')
+OUTPUT_FILE_PATH = os.path.join(PUBLIC_DIR, 'company_tickers.json')
+INDEX_FILE_NAME = 'company_tickers_index.json'
+DEFAULT_STATE_PATH = os.getenv('TICKERS_STATE_FILE', '.company_tickers_state.json')
+
+INDEX_VERSION = 1
+NGRAM_SIZE = 3
+# Legal suffixes dropped from company names before matching
+COMPANY_SUFFIX = re.compile(r',?\s+(inc|corporation|corp|ltd|llc)\.?')
+# Keys JavaScript objects enumerate first, in ascending numeric order
+ARRAY_INDEX_KEY = re.compile(r'^(0|[1-9][0-9]*)$')
+
+def normalize_company_name(name):
+    """Lowercases a company name and strips legal suffixes like ', Inc.'."""
+    return COMPANY_SUFFIX.sub('', name.lower()).strip()
+
+def build_name_index(tickers):
+    """
+    Builds the deepmoney name index from the ticker list.
+
+    `names` and `tickers` are the normalized names and their tickers in the order the
+    route tries them (the enumeration order of a JS object keyed by normalized name,
+    the last ticker winning for duplicate names); `ngrams` maps every trigram to the
+    ascending positions of the names containing it.
+    """
+    by_name = {}
+    for entry in tickers:
+        if entry.get('name'):
+            by_name[normalize_company_name(entry['name'])] = entry['ticker']
+
+    array_index_keys = {name for name in by_name if ARRAY_INDEX_KEY.match(name) and int(name) < 2 ** 32 - 1}
+    ordered = sorted(array_index_keys, key=int) + [name for name in by_name if name not in array_index_keys]
+
+    ngrams = {}
+    for position, name in enumerate(ordered):
+        # Sorted, as set order varies with PYTHONHASHSEED and the file must be byte-stable
+        for gram in sorted({name[i:i + NGRAM_SIZE] for i in range(len(name) - NGRAM_SIZE + 1)}):
+            ngrams.setdefault(gram, []).append(position)
 
-def update_company_tickers(url, output_path):
+    return {
+        'version': INDEX_VERSION,
+        'ngramSize': NGRAM_SIZE,
+        'names': ordered,
+        'tickers': [by_name[name] for name in ordered],
+        'ngrams': ngrams,
+    }
+
+def compact_json(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def read_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def load_validators(state_path):
+    """Returns the saved {'etag', 'last_modified'} of the last download, or {}."""
+    if not state_path:
+        return {}
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_validators(state_path, response):
+    if not state_path:
+        return
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    write_file_atomic(state_path, compact_json(validators))
+
+def write_name_index(tickers, index_path):
+    """Writes the name index, unless it is already up to date. Returns True if written."""
+    content = compact_json(build_name_index(tickers))
+    if read_file(index_path) == content:
+        return False
+    write_file_atomic(index_path, content)
+    return True
+
+def update_company_tickers(url, output_path, metrics=None, index_path=None, state_path=None):
     """
-    Downloads a JSON file from a given URL and saves it to a specified local path.
+    Downloads a JSON file from a given URL and saves it to a specified local path,
+    together with its name index (by default next to it). With a state_path the
+    request is conditional on the validators of the previous download.
+    The download is audited and timed in `metrics` (an ingest_metrics.RunMetrics).
+    Returns True if the tickers file was rewritten.
     """
+    if metrics is None:
+        metrics = RunMetrics('update_tickers')
+    if index_path is None:
+        index_path = os.path.join(os.path.dirname(output_path), INDEX_FILE_NAME)
+
+    headers = {}
+    if os.path.exists(output_path):
+        validators = load_validators(state_path)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        company_tickers_data = response.json()
+        with metrics.stage('download'):
+            started = time.perf_counter()
+            try:
+                response = requests.get(url, headers=headers)
+            except requests.exceptions.RequestException as e:
+                metrics.api_call('tickers', url, seconds=time.perf_counter() - started, error=str(e))
+                raise
+            metrics.api_call('tickers', url, status=response.status_code,
+                             seconds=time.perf_counter() - started, response_bytes=len(response.content))
+            if response.status_code == 304:
+                print(f"{output_path} is up to date (not modified upstream).")
+                if not os.path.exists(index_path):
+                    with open(output_path) as f:
+                        write_name_index(json.load(f), index_path)
+                return False
+            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+            company_tickers_data = response.json()
 
         # Ensure the directory exists
         output_dir = os.path.dirname(output_path)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        with open(output_path, 'w') as f:
-            json.dump(company_tickers_data, f, indent=4)
-        print(f"Successfully updated {output_path}")
+        with metrics.stage('write', rows=len(company_tickers_data)) as stage:
+            content = compact_json(company_tickers_data)
+            changed = read_file(output_path) != content
+            if changed:
+                write_file_atomic(output_path, content)
+            stage['changed'] = changed
+            stage['index_written'] = write_name_index(company_tickers_data, index_path)
+        save_validators(state_path, response)
+        metrics.count('rows', len(company_tickers_data))
+        if changed:
+            print(f"Successfully updated {output_path}")
+        else:
+            print(f"{output_path} is unchanged, skipped rewriting it.")
+        return changed
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data from {url}: {e}")
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from {url}: {e}")
     except IOError as e:
         print(f"Error writing to file {output_path}: {e}")
+    return False
+
+def parse_args():
+    """Parses command line options."""
+    parser = argparse.ArgumentParser(description="Refresh the company ticker list and its name index.")
+    parser.add_argument('--url', default=SEC_TICKERS_URL, help="Ticker list URL (default: %(default)s).")
+    parser.add_argument('--output', default=OUTPUT_FILE_PATH, help="Tickers JSON file (default: %(default)s).")
+    parser.add_argument(
+        '--state-file',
+        default=DEFAULT_STATE_PATH,
+        help="File keeping the ETag/Last-Modified of the last download (default: %(default)s)."
+    )
+    parser.add_argument(
+        '--rebuild-index',
+        action='store_true',
+        help="Only rebuild the name index from the existing tickers file, without downloading."
+    )
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    SEC_TICKERS_URL = "https://dumbstockapi.com/stock?exchanges=NYSE,NASDAQ&format=json"
-    OUTPUT_FILE_PATH = "/Users/kbollma/Projects/www/moneygoup/public/company_tickers.json"
-    update_company_tickers(SEC_TICKERS_URL, OUTPUT_FILE_PATH)
+    args = parse_args()
+    if args.rebuild_index:
+        with open(args.output) as f:
+            write_name_index(json.load(f), os.path.join(os.path.dirname(args.output), INDEX_FILE_NAME))
+        print("Rebuilt the name index.")
+    else:
+        metrics = RunMetrics('update_tickers', DEFAULT_EVENTS_PATH, DEFAULT_TEXTFILE_DIR)
+        update_company_tickers(args.url, args.output, metrics, state_path=args.state_file)
+        metrics.close()